@@ -2,6 +2,7 @@ import javax.swing.*;
 import java.awt.*;
 import java.awt.event.ActionListener;
 import java.io.*;
+import java.nio.charset.StandardCharsets;
 import java.util.HashMap;
 import java.awt.event.WindowAdapter;
 import java.awt.event.WindowEvent;
@@ -12,8 +13,9 @@ public class PythonOutputGUI {
     private JButton startButton, pauseButton;
     private JButton sendButton, startAudioButton, stopButton;
     private boolean isPaused = false;
-    private BufferedWriter pythonWriter;
-    private BufferedReader pythonReader;
+    private DataOutputStream pythonWriter;
+    private DataInputStream pythonReader;
+    private int pendingReplyStart = -1; // start of the streamed (not yet final) reply in textArea
     private JTextField inputField;
     private boolean conversationRunning = false;
     private String selectedLanguage = "English"; // Default language
@@ -117,7 +119,7 @@ public class PythonOutputGUI {
         pauseButton.addActionListener(e -> togglePauseResume());
         stopButton.addActionListener(e -> stopPythonScript());
         sendButton.addActionListener(e -> sendTextInputToPython());
-        startAudioButton.addActionListener(e -> sendToPython("START_AUDIO"));
+        startAudioButton.addActionListener(e -> sendToPython("command", "name", "start_audio"));
 
         frame.addWindowListener(new WindowAdapter() {
             @Override
@@ -136,6 +138,7 @@ public class PythonOutputGUI {
         }
 
         textArea.setText("");
+        pendingReplyStart = -1;
 
         try {
             ProcessBuilder pb = new ProcessBuilder("python", "-u", "penpal.py", this.selectedLanguage, this.cultureProfiles.get(this.selectedLanguage)); // Ensure unbuffered output
@@ -144,19 +147,23 @@ public class PythonOutputGUI {
             System.out.println("Process started with PID: " + process.pid());
             conversationRunning = true;
 
-            pythonReader = new BufferedReader(new InputStreamReader(process.getInputStream()));
-            pythonWriter = new BufferedWriter(new OutputStreamWriter(process.getOutputStream()));
+            pythonReader = new DataInputStream(new BufferedInputStream(process.getInputStream()));
+            pythonWriter = new DataOutputStream(new BufferedOutputStream(process.getOutputStream()));
             BufferedReader errorReader = new BufferedReader(new InputStreamReader(process.getErrorStream()));
 
-            // Read output in a separate thread
+            // Read framed messages in a separate thread
             stdoutThread = new Thread(() -> {
-                String line;
                 try {
-                    while ((line = pythonReader.readLine()) != null) {
-                        String finalLine = line;
-                        System.out.println("Python Output: " + line); // Debug output
-                        SwingUtilities.invokeLater(() -> textArea.append(finalLine + "\n")); // Ensure safe UI updates
+                    while (true) {
+                        int length = pythonReader.readInt();
+                        byte[] payload = new byte[length];
+                        pythonReader.readFully(payload);
+                        String message = new String(payload, StandardCharsets.UTF_8);
+                        System.out.println("Python Output: " + message); // Debug output
+                        SwingUtilities.invokeLater(() -> handleMessage(message)); // Ensure safe UI updates
                     }
+                } catch (EOFException ex) {
+                    // Python closed stdout, the conversation is over
                 } catch (Exception ex) {
                     if (conversationRunning) {
                         System.err.println("Error: Unable to read from Python process. The stream may be closed.");
@@ -183,10 +190,101 @@ public class PythonOutputGUI {
         }
     }
 
-    private void sendToPython(String message) {
+    private void handleMessage(String message) {
+        // Messages are flat JSON objects, see protocol.py
+        String type = jsonString(message, "type");
+        String text = jsonString(message, "text");
+        String name = jsonString(message, "name");
+        if (type == null || text == null) {
+            return; // metrics and unknown messages are only logged
+        }
+
+        switch (type) {
+            case "delta":
+                if (pendingReplyStart < 0) {
+                    pendingReplyStart = textArea.getDocument().getLength();
+                    textArea.append(name + ": ");
+                }
+                textArea.append(text);
+                break;
+            case "reply":
+                // The final reply replaces the streamed preview
+                if (pendingReplyStart >= 0) {
+                    textArea.replaceRange("", pendingReplyStart, textArea.getDocument().getLength());
+                    pendingReplyStart = -1;
+                }
+                textArea.append(name + ": " + text + "\n");
+                break;
+            case "error":
+                System.err.println("Python Error: " + text);
+                textArea.append(text + "\n");
+                break;
+            default:
+                textArea.append(text + "\n");
+        }
+    }
+
+    private static String jsonString(String json, String key) {
+        // Minimal lookup of a top-level string value, enough for the flat messages sent by protocol.py
+        String needle = "\"" + key + "\": \"";
+        int start = json.indexOf(needle);
+        if (start < 0) {
+            return null;
+        }
+        StringBuilder value = new StringBuilder();
+        for (int i = start + needle.length(); i < json.length(); i++) {
+            char c = json.charAt(i);
+            if (c == '"') {
+                return value.toString();
+            }
+            if (c == '\\' && i + 1 < json.length()) {
+                char next = json.charAt(++i);
+                switch (next) {
+                    case 'n': value.append('\n'); break;
+                    case 't': value.append('\t'); break;
+                    case 'r': value.append('\r'); break;
+                    case 'b': value.append('\b'); break;
+                    case 'f': value.append('\f'); break;
+                    case 'u':
+                        value.append((char) Integer.parseInt(json.substring(i + 1, i + 5), 16));
+                        i += 4;
+                        break;
+                    default: value.append(next); // \" \\ and \/
+                }
+            } else {
+                value.append(c);
+            }
+        }
+        return null;
+    }
+
+    private static String jsonEscape(String value) {
+        StringBuilder escaped = new StringBuilder();
+        for (char c : value.toCharArray()) {
+            switch (c) {
+                case '"': escaped.append("\\\""); break;
+                case '\\': escaped.append("\\\\"); break;
+                case '\n': escaped.append("\\n"); break;
+                case '\r': escaped.append("\\r"); break;
+                case '\t': escaped.append("\\t"); break;
+                default:
+                    if (c < 0x20) {
+                        escaped.append(String.format("\\u%04x", (int) c));
+                    } else {
+                        escaped.append(c);
+                    }
+            }
+        }
+        return escaped.toString();
+    }
+
+    private void sendToPython(String type, String key, String value) {
         try {
             if (pythonWriter != null) {
-                pythonWriter.write(message + "\n");
+                String message = "{\"type\": \"" + type + "\", \"" + key + "\": \"" + jsonEscape(value) + "\"}";
+                byte[] payload = message.getBytes(StandardCharsets.UTF_8);
+                pythonWriter.writeInt(payload.length); // 4-byte big-endian length prefix
+                pythonWriter.write(payload);
                 pythonWriter.flush();
             }
         } catch (IOException e) {
@@ -196,15 +294,10 @@ public class PythonOutputGUI {
 
     private void sendTextInputToPython() {
         if (process != null && pythonWriter != null) {
-            try {
-                String userInput = inputField.getText().trim();
-                if (!userInput.isEmpty()) {
-                    pythonWriter.write(userInput + "\n");
-                    pythonWriter.flush();
-                    inputField.setText(""); // Clear input field after sending
-                }
-            } catch (IOException e) {
-                System.err.println("Error: Unable to send user input to Python process. The stream may be closed.");
+            String userInput = inputField.getText().trim();
+            if (!userInput.isEmpty()) {
+                sendToPython("input", "text", userInput);
+                inputField.setText(""); // Clear input field after sending
             }
         }
     }
@@ -230,7 +323,7 @@ public class PythonOutputGUI {
             try {
                 // Send the EXIT command to the Python script
                 if (pythonWriter != null) {
-                    sendToPython("EXIT");
+                    sendToPython("command", "name", "exit");
                     pythonWriter.close(); // Close the writer
                     System.out.println("Writer closed\n");
                 }
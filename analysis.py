@@ -7,45 +7,23 @@ import seaborn as sns
 import matplotlib.pyplot as plt
 import numpy as np
 import re
+import argparse
+
+from pipeline import Task, run as run_pipeline
+from resampling import paired_resampling
+from ingestion import read_csv_cached, fill_missing_pairs, likert_to_scores, count_languages_series, LIKERT_SCALE
 
 # Set path (update as needed)
 path = "data"
+LANGUAGES = ["Spanish", "French", "Japanese", "German"]
 
 word_recall_results = []
 engagement_results = []
 
 # DATA PROCESSING
 def replace_missing_rows(memory_df, no_memory_df):
-    # replace with the column average
-
-    memory_ids = set(memory_df['ID'])
-    no_memory_ids = set(no_memory_df['ID'])
-
-    # Find unmatched IDs
-    only_in_memory = memory_ids - no_memory_ids
-    only_in_no_memory = no_memory_ids - memory_ids
-
-    # Fill in missing no_memory rows
-    for pid in only_in_memory:
-        avg_score = no_memory_df['Score'].mean()
-        fake_row = pd.DataFrame([{
-            'ID': pid,
-            'Score': avg_score,
-            'Memory': 0
-        }])
-        no_memory_df = pd.concat([no_memory_df, fake_row], ignore_index=True)
-
-    # Fill in missing memory rows
-    for pid in only_in_no_memory:
-        avg_score = memory_df['Score'].mean()
-        fake_row = pd.DataFrame([{
-            'ID': pid,
-            'Score': avg_score,
-            'Memory': 1
-        }])
-        memory_df = pd.concat([memory_df, fake_row], ignore_index=True)
-
-    return memory_df, no_memory_df
+    # replace with the column average (vectorized, see ingestion.fill_missing_pairs)
+    return fill_missing_pairs(memory_df, no_memory_df)
 
 def remove_missing_rows(memory_df,no_memory_df):
     common_ids = set(memory_df['ID']).intersection(
@@ -75,8 +53,8 @@ def count_languages(text):
 
 # LOAD DATA
 def load_data(language):
-    memory_df = pd.read_csv(os.path.join(path, f"Memory-{language}.csv"))
-    no_memory_df = pd.read_csv(os.path.join(path, f"No-memory-{language}.csv"))
+    memory_df = read_csv_cached(f"Memory-{language}.csv", data_dir=path)
+    no_memory_df = read_csv_cached(f"No-memory-{language}.csv", data_dir=path)
     
     memory_df['Memory'] = 1 # Assign 1 for memory 
     no_memory_df['Memory'] = 0 # Assign 0 for no memory
@@ -107,7 +85,7 @@ def load_data_all_languages(languages):
     return pd.concat(all_data, ignore_index=True)
 
 def load_engagement_data():
-    engagement_df = pd.read_csv(os.path.join(path, "Survey.csv"))
+    engagement_df = read_csv_cached("Survey.csv", data_dir=path)
 
     engagement_df = engagement_df.rename(columns={
         'Please enter your participant ID': 'ID',
@@ -117,8 +95,7 @@ def load_engagement_data():
     engagement_df.dropna(how='any', inplace=True)
     
     engagement_columns = engagement_df.columns[5:17]
-    for col in engagement_columns:
-        engagement_df[col] = engagement_df[col].apply(convert_likert_response)
+    engagement_df = likert_to_scores(engagement_df, engagement_columns)
 
     memory_df = engagement_df[engagement_df['Memory'] == 'Yes']
     no_memory_df = engagement_df[engagement_df['Memory'] == 'No']
@@ -134,8 +111,8 @@ def load_engagement_data():
 
 # PLOTTING
 def plot_word_recall_scores(language):
-    memory_df = pd.read_csv(os.path.join(path, f"Memory-{language}.csv"))
-    no_memory_df = pd.read_csv(os.path.join(path, f"No-memory-{language}.csv"))
+    memory_df = read_csv_cached(f"Memory-{language}.csv", data_dir=path)
+    no_memory_df = read_csv_cached(f"No-memory-{language}.csv", data_dir=path)
 
     memory_df['Memory'] = 1
     no_memory_df['Memory'] = 0
@@ -270,31 +247,35 @@ def word_recall_individual_analysis():
 #     plt.show()
 #     plt.close()
 
-def measure_word_recall_all_languages():
-    import scipy.stats as stats
-    languages = ["Spanish", "French", "Japanese", "German"]
+def load_recall_scores(languages=LANGUAGES):
     all_data = load_data_all_languages(languages)
+    all_data['Score'] = pd.to_numeric(all_data['Score'], errors='coerce')
+    all_data.dropna(subset=['Score'], inplace=True)
+    return all_data
 
+def export_recall_all_languages():
     # Save all combined data
     os.makedirs("output", exist_ok=True)
-    all_data.to_csv("output/recall_all_languages.csv", index=False)
+    load_data_all_languages(LANGUAGES).to_csv("output/recall_all_languages.csv", index=False)
 
-    all_data['Score'] = pd.to_numeric(all_data['Score'], errors='coerce')
-    all_data.dropna(subset=['Score'], inplace=True)
-
-    # print(all_data['Score'].describe())
+def fit_recall_mixed_model():
+    all_data = load_recall_scores()
 
     # Mixed-effects model (overall effect of memory)
     model = smf.mixedlm("Score ~ C(Memory)", data=all_data, groups=all_data["Language"])
     model_fit = model.fit()
     print(model_fit.summary())
 
+    os.makedirs("output", exist_ok=True)
     with open("output/recall_mixed_effects_model_summary.txt", "w") as f:
         f.write(str(model_fit.summary()))
 
+def test_recall_per_language():
+    all_data = load_recall_scores()
+
     # Language-wise comparison results
     results = []
-    for lang in languages:
+    for lang in LANGUAGES:
         subset = all_data[all_data["Language"] == lang]
         pivoted = subset.pivot(index="ID", columns="Memory", values="Score").dropna()
         if pivoted.shape[0] < 2:
@@ -323,22 +304,31 @@ def measure_word_recall_all_languages():
 
     # Save per-language test results
     results_df = pd.DataFrame(results)
+    os.makedirs("output", exist_ok=True)
     results_df.to_csv("output/recall_per_language_stats.csv", index=False)
     print(results_df)
 
-    # Plot
+def plot_recall_violin():
+    all_data = load_recall_scores()
+
     os.makedirs("plots/recall", exist_ok=True)
+    plt.figure()
     sns.violinplot(data=all_data, x="Language", y="Score", hue="Memory", split=True, palette="pastel")
     plt.title("Distribution of Word Recall Scores by Language and Memory Condition")
     plt.savefig("plots/recall/recall_violin_plot.png")
-    plt.show()
     plt.close()
 
+def measure_word_recall_all_languages():
+    export_recall_all_languages()
+    fit_recall_mixed_model()
+    test_recall_per_language()
+    plot_recall_violin()
+
 
 # PARTICIPANT BACKGROUND EFFECTS ON WORD RECALL
 def analyze_background_effects_on_word_recall():
     # 1. Load the survey data
-    survey_df = pd.read_csv(os.path.join(path, "Survey.csv"))
+    survey_df = read_csv_cached("Survey.csv", data_dir=path)
     
     survey_df.columns = survey_df.columns.str.strip()
 
@@ -354,8 +344,8 @@ def analyze_background_effects_on_word_recall():
 
     survey_info['PriorExperience'] = survey_info['PriorExperience'].map({'Yes': 1, 'No': 0})
     survey_info['CAFamiliarity'] = survey_info['CAFamiliarity'].map({'Yes': 1, 'No': 0})
-    # convert the strings of languages into a count using regex function above
-    survey_info['NumLanguages'] = survey_info['NumLanguages'].apply(count_languages)
+    # convert the strings of languages into a count (vectorized version of count_languages above)
+    survey_info['NumLanguages'] = count_languages_series(survey_info['NumLanguages'])
 
     # drop duplicates as participants filled in this part twice but entries didnt change
     survey_info = survey_info.drop_duplicates(subset=['ID'])
@@ -392,14 +382,7 @@ def compute_composite_scores(df, min_col, max_col, new_col_name):
     return df
 
 def convert_likert_response(response):
-    mapping = {
-        "Strongly Disagree": 1,
-        "Disagree": 2,
-        "Neither agree nor disagree": 3,
-        "Agree": 4,
-        "Strongly agree": 5
-    }
-    return mapping.get(response, None)
+    return LIKERT_SCALE.get(response, None)
 
 def merge_engagement_data(memory_df, no_memory_df, engagement_columns):
     # Extract columns [5:17] and rename them to engagement_columns
@@ -431,15 +414,15 @@ def test_category_effect(engagement_df, category):
         'p-value': p_value
     })
 
-def test_user_engagement():
-    # Map questions to categories
-    categories = {
-        'FA': ['FA_Q1', 'FA_Q2', 'FA_Q3'],
-        'PU': ['PU_Q1', 'PU_Q2', 'PU_Q3'],
-        'AE': ['AE_Q1', 'AE_Q2', 'AE_Q3'],
-        'RW': ['RW_Q1', 'RW_Q2', 'RW_Q3']
-    }
+# Map questions to categories
+ENGAGEMENT_CATEGORIES = {
+    'FA': ['FA_Q1', 'FA_Q2', 'FA_Q3'],
+    'PU': ['PU_Q1', 'PU_Q2', 'PU_Q3'],
+    'AE': ['AE_Q1', 'AE_Q2', 'AE_Q3'],
+    'RW': ['RW_Q1', 'RW_Q2', 'RW_Q3']
+}
 
+def compute_engagement_scores(categories=ENGAGEMENT_CATEGORIES):
     # Flatten all category questions into engagement_columns
     engagement_columns = [q for questions in categories.values() for q in questions]
 
@@ -457,13 +440,90 @@ def test_user_engagement():
     # Print merged DataFrame info
     print(merged.columns)
     print(merged.shape)
+    return merged
+
+def test_user_engagement():
+    merged = compute_engagement_scores()
 
     # Test the effect of memory condition on each category
-    for category in categories.keys():
+    for category in ENGAGEMENT_CATEGORIES.keys():
         test_category_effect(merged, category)
 
     # Plot the engagement scores
-    plot_engagement_category_distributions(merged, categories)
+    plot_engagement_category_distributions(merged, ENGAGEMENT_CATEGORIES)
+
+def write_engagement_results():
+    engagement_results.clear()
+    merged = compute_engagement_scores()
+    for category in ENGAGEMENT_CATEGORIES.keys():
+        test_category_effect(merged, category)
+    os.makedirs("output", exist_ok=True)
+    pd.DataFrame(engagement_results).to_csv("output/engagement_results.csv", index=False)
+
+def plot_engagement():
+    plot_engagement_category_distributions(compute_engagement_scores(), ENGAGEMENT_CATEGORIES)
+
+# RESAMPLING (PERMUTATION TESTS AND BOOTSTRAP CONFIDENCE INTERVALS)
+def paired_differences(df, value_column):
+    # memory minus no memory score per participant, participants missing a condition are dropped
+    paired = df.pivot_table(index='ID', columns='Memory', values=value_column, aggfunc='mean').dropna()
+    return (paired[1] - paired[0]).to_numpy()
+
+def resample_effects(n_resamples=20000, seed=42, jobs=1):
+    # All languages and engagement categories are resampled together in one batch
+    groups = {}
+    recall = load_recall_scores()
+    for lang in LANGUAGES:
+        groups[lang] = paired_differences(recall[recall['Language'] == lang], 'Score')
+
+    engagement = compute_engagement_scores()
+    engagement['Memory'] = engagement['Memory'].astype(int)
+    for category in ENGAGEMENT_CATEGORIES.keys():
+        groups[category] = paired_differences(engagement, category)
+
+    results = pd.DataFrame(paired_resampling(groups, n_resamples=n_resamples, seed=seed, jobs=jobs))
+    print(results)
+
+    # Written next to the rank-based test results
+    os.makedirs("output", exist_ok=True)
+    recall_results = results[results['Group'].isin(LANGUAGES)].rename(columns={'Group': 'Language'})
+    recall_results.to_csv("output/recall_resampling_stats.csv", index=False)
+    engagement_results_df = results[results['Group'].isin(ENGAGEMENT_CATEGORIES.keys())].rename(columns={'Group': 'Category'})
+    engagement_results_df.to_csv("output/engagement_resampling_stats.csv", index=False)
+
+# CONVERSATION LOGS (see log_analytics.py)
+def load_recall_test_times(languages=LANGUAGES):
+    # when each participant submitted the recall test of each condition
+    frames = []
+    for lang in languages:
+        for condition, memory in [("Memory", 1), ("No-memory", 0)]:
+            df = read_csv_cached(f"{condition}-{lang}.csv", data_dir=path)
+            df.columns = df.columns.str.strip()
+            df = df[['Timestamp', 'Please enter your participant ID']].rename(columns={"Please enter your participant ID": "ID"})
+            df['Culture'] = lang
+            df['Memory'] = memory
+            frames.append(df)
+    tests = pd.concat(frames, ignore_index=True)
+    tests['Timestamp'] = pd.to_datetime(tests['Timestamp'])
+    return tests
+
+def join_log_sessions(sessions_file="output/conversation_log_sessions.csv", tolerance_minutes=120):
+    """
+    Attach participant IDs and memory condition to the logged sessions: a session belongs to the
+    participant whose recall test for that culture was submitted next, within the tolerance.
+    """
+    sessions = pd.read_csv(sessions_file, parse_dates=['Start', 'End'])
+    tests = load_recall_test_times()
+    joined = pd.merge_asof(
+        sessions.sort_values('End'), tests.sort_values('Timestamp'),
+        left_on='End', right_on='Timestamp', by='Culture',
+        direction='forward', tolerance=pd.Timedelta(minutes=tolerance_minutes)
+    ).rename(columns={'Timestamp': 'Recall_Test_Time'})
+
+    os.makedirs("output", exist_ok=True)
+    joined.to_csv("output/conversation_log_sessions_by_participant.csv", index=False)
+    print(f"Matched {joined['ID'].notna().sum()} of {len(joined)} logged sessions to a participant")
+    return joined
 
 #begums version
 def test_word_recall2(language, data):
@@ -486,18 +546,51 @@ def test_word_recall2(language, data):
         'p-value': p_value
     })
 
-if __name__ == "__main__":
-    # 1. Word Recall Analysis
-    # word_recall_individual_analysis()
-    # pd.DataFrame(word_recall_results).to_csv("output/word_recall_results.csv", index=False)
-
-    measure_word_recall_all_languages()
-
-    analyze_background_effects_on_word_recall()
-
-    # 2. User Engagement Analysis
-    test_user_engagement()
-    pd.DataFrame(engagement_results).to_csv("output/engagement_results.csv", index=False)
-
-
+def analysis_tasks():
+    """
+    Every file in output/ and plots/ as a pipeline task with the data and code it is computed from.
+    output/word_recall_results.csv comes from the older per-language analysis (word_recall_individual_analysis)
+    and is left alone.
+    """
+    code = ["analysis.py", "ingestion.py"]
+    recall_data = [os.path.join(path, f"{condition}-{lang}.csv") for lang in LANGUAGES for condition in ["Memory", "No-memory"]]
+    survey_data = [os.path.join(path, "Survey.csv")]
+
+    tasks = [
+        Task("recall_all_languages", export_recall_all_languages, recall_data + code, ["output/recall_all_languages.csv"]),
+        Task("recall_mixed_model", fit_recall_mixed_model, recall_data + code, ["output/recall_mixed_effects_model_summary.txt"]),
+        Task("recall_per_language_stats", test_recall_per_language, recall_data + code, ["output/recall_per_language_stats.csv"]),
+        Task("recall_violin_plot", plot_recall_violin, recall_data + code, ["plots/recall/recall_violin_plot.png"]),
+        Task("background_effects", analyze_background_effects_on_word_recall, recall_data + survey_data + code,
+             ["output/recall_background_effects_summary.txt"]),
+        Task("engagement_results", write_engagement_results, survey_data + code, ["output/engagement_results.csv"]),
+        Task("engagement_violin_plot", plot_engagement, survey_data + code, ["plots/engagement/category_violin_plot.png"]),
+        Task("resampling_stats", resample_effects, recall_data + survey_data + code + ["resampling.py"],
+             ["output/recall_resampling_stats.csv", "output/engagement_resampling_stats.csv"]),
+    ]
+    # only once log_analytics.py has been run on the pen pal logs
+    sessions_file = "output/conversation_log_sessions.csv"
+    if os.path.exists(sessions_file):
+        tasks.append(Task("log_sessions_by_participant", join_log_sessions, [sessions_file] + recall_data + code,
+                          ["output/conversation_log_sessions_by_participant.csv"]))
+    for lang in LANGUAGES:
+        lang_data = [os.path.join(path, f"Memory-{lang}.csv"), os.path.join(path, f"No-memory-{lang}.csv")]
+        tasks.append(Task(f"{lang.lower()}_score_distribution", plot_word_recall_scores, lang_data + code,
+                          [f"plots/recall/{lang}_score_distribution.png"], args=(lang,)))
+    return tasks
 
+if __name__ == "__main__":
+    # Every output is a task, independent tasks run in parallel and unchanged ones are skipped
+    parser = argparse.ArgumentParser(description="Run the word recall and engagement analyses")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes (default: number of CPUs)")
+    parser.add_argument("--force", action="store_true", help="rerun every task even if its inputs did not change")
+    parser.add_argument("--only", nargs="*", help="only run the named tasks")
+    args = parser.parse_args()
+
+    tasks = analysis_tasks()
+    if args.only:
+        tasks = [task for task in tasks if task.name in args.only]
+
+    status = run_pipeline(tasks, jobs=args.jobs, force=args.force)
+    if "failed" in status.values():
+        raise SystemExit(1)
@@ -0,0 +1,48 @@
+import re
+
+# Each turn in pen_pal_data/<culture>_conversations.txt is written by CulturalPenPal.add_to_short_term_memory as
+#   TIME: <iso timestamp>
+#   USER: <user input>
+#   <NAME>: <response, possibly spanning several lines>
+#   <blank line>
+TIME_PREFIX = "TIME: "
+USER_PREFIX = "USER: "
+TIME_PATTERN = re.compile(r"^TIME: (\S+)$", re.MULTILINE)
+SPEAKER_PATTERN = re.compile(r"^([^:\n]+): ?(.*)$", re.DOTALL)
+
+def format_turn(timestamp, user_input, speaker, response):
+    """Render one turn exactly as it is appended to the conversation log"""
+    return f"{TIME_PREFIX}{timestamp}\n{USER_PREFIX}{user_input}\n{speaker.upper()}: {response}\n\n"
+
+def _build_turn(lines):
+    if len(lines) < 2 or not lines[0].startswith(TIME_PREFIX) or not lines[1].startswith(USER_PREFIX):
+        return None
+    reply = "\n".join(lines[2:]).rstrip("\n")
+    match = SPEAKER_PATTERN.match(reply)
+    speaker, response = (match.group(1), match.group(2)) if match else ("", reply)
+    return {
+        "time": lines[0][len(TIME_PREFIX):].strip(),
+        "user": lines[1][len(USER_PREFIX):],
+        "speaker": speaker,
+        "response": response
+    }
+
+def iter_log_turns(path, offset=0):
+    """Stream the turns of a conversation log one at a time, in constant memory, starting at a byte offset on a turn boundary"""
+    lines = []
+    # builtin open decodes in large blocks, much faster than codecs.open on big logs
+    with open(path, "r", encoding="utf-8", errors="replace", newline="") as f:
+        if offset:
+            f.buffer.seek(offset)
+        for line in f:
+            line = line.rstrip("\r\n")
+            # A turn starts with a TIME line at the top of the file or right after a blank line
+            if line.startswith(TIME_PREFIX) and (not lines or lines[-1] == ""):
+                turn = _build_turn(lines)
+                if turn is not None:
+                    yield turn
+                lines = []
+            lines.append(line)
+    turn = _build_turn(lines)
+    if turn is not None:
+        yield turn
@@ -0,0 +1,267 @@
+import sys
+import json
+import wave
+import random
+import argparse
+import numpy as np
+
+from pathlib import Path
+from collections import deque
+
+# Silence that ends a turn before anything is learned about the learner. Beginners pause
+# longer to find words in the language they are learning than in English.
+ENGLISH_PAUSE = 0.8
+TARGET_LANGUAGE_PAUSE = 1.4
+MIN_PAUSE = 0.5
+MAX_PAUSE = 2.5
+FIXED_PAUSE = 2.0 # what listen_for_input used before (recognizer.pause_threshold)
+
+PAUSE_QUANTILE = 0.98 # the threshold sits above this share of the learner's pauses within a turn
+PAUSE_MARGIN = 0.3 # seconds added on top of that pause
+MIN_OBSERVED_PAUSES = 5 # pauses seen before the learned threshold starts to replace the prior
+PAUSE_HISTORY = 200
+
+SPEECH_RATIO = 3.0 # energy over the noise floor that counts as speech
+MIN_ENERGY = 50.0 # RMS of 16-bit samples below which nothing is speech, even in a silent room
+START_FRAMES = 3 # consecutive speech frames that start an utterance (ignores clicks)
+MIN_GAP = 0.15 # silences shorter than this are within a word, not a pause
+NOISE_ADAPTATION = 0.05
+PREROLL = 0.3 # audio kept before the detected start of speech
+TAIL = 0.2 # audio kept after the detected end of speech, the rest of the trailing silence is cut
+
+def frame_energy(chunk):
+    """RMS energy of a chunk of 16-bit mono PCM"""
+    samples = np.frombuffer(chunk, dtype=np.int16).astype(np.float32)
+    return float(np.sqrt(np.mean(samples * samples))) if len(samples) else 0.0
+
+class UtteranceDetector:
+    def __init__(self, pause_threshold, noise_floor, frame_seconds):
+        """
+        Streaming energy-based voice activity detection for one utterance.
+
+        Args:
+            pause_threshold (float): Seconds of silence after speech that end the utterance
+            noise_floor (float): Energy of the background noise (adapted while nobody speaks)
+            frame_seconds (float): Duration of one pushed frame
+        """
+        self.pause_threshold = pause_threshold
+        self.noise_floor = noise_floor
+        self.frame_seconds = frame_seconds
+        self.frames = 0
+        self.speech_start = None
+        self.speech_end = None
+        self.speech_run = 0
+        self.silence_run = 0
+        self.pauses = []
+        self.ended = False
+
+    def push(self, energy):
+        """Feed the energy of the next frame, returns True once the utterance has ended"""
+        index = self.frames
+        self.frames += 1
+        if energy > max(self.noise_floor * SPEECH_RATIO, MIN_ENERGY):
+            self.speech_run += 1
+            if self.speech_start is None and self.speech_run >= START_FRAMES:
+                self.speech_start = index - START_FRAMES + 1
+            if self.speech_start is not None:
+                pause = self.silence_run * self.frame_seconds
+                if pause >= MIN_GAP:
+                    self.pauses.append(pause)
+                self.silence_run = 0
+                self.speech_end = index + 1
+        else:
+            self.speech_run = 0
+            if self.speech_start is None:
+                self.noise_floor += NOISE_ADAPTATION * (energy - self.noise_floor)
+            else:
+                self.silence_run += 1
+                if self.silence_run * self.frame_seconds >= self.pause_threshold:
+                    self.ended = True
+        return self.ended
+
+    def audio_range(self, preroll=PREROLL, tail=TAIL):
+        """Frames to keep: the speech plus a little context, without the trailing silence"""
+        start = max(self.speech_start - int(preroll / self.frame_seconds), 0)
+        end = min(self.speech_end + int(tail / self.frame_seconds), self.frames)
+        return start, end
+
+class AdaptiveEndpointer:
+    def __init__(self, history=PAUSE_HISTORY):
+        """
+        End-of-speech detection that learns how long the learner pauses within a turn, per language.
+
+        Until enough pauses are observed the threshold is a per-language prior (longer for the
+        target language), then it moves to just above the learner's own pauses.
+        """
+        self.history = history
+        self.pauses = {}
+
+    def pause_threshold(self, language):
+        prior = ENGLISH_PAUSE if language.lower().startswith("en") else TARGET_LANGUAGE_PAUSE
+        observed = self.pauses.get(language)
+        if not observed or len(observed) < MIN_OBSERVED_PAUSES:
+            return prior
+        learned = float(np.quantile(observed, PAUSE_QUANTILE)) + PAUSE_MARGIN
+        # trust the learned value more as pauses accumulate
+        weight = min(len(observed) / (4 * MIN_OBSERVED_PAUSES), 1.0)
+        return float(np.clip(weight * learned + (1 - weight) * prior, MIN_PAUSE, MAX_PAUSE))
+
+    def observe(self, language, pauses):
+        self.pauses.setdefault(language, deque(maxlen=self.history)).extend(pauses)
+
+    def detector(self, language, noise_floor, frame_seconds):
+        return UtteranceDetector(self.pause_threshold(language), noise_floor, frame_seconds)
+
+    def listen(self, source, language, timeout=20, phrase_time_limit=30, calibration=0.5):
+        """
+        Record one utterance from an open speech_recognition Microphone.
+
+        Args:
+            source (sr.Microphone): The open microphone
+            language (str): Recognition language, e.g. 'en-US' or 'fr-FR'
+            timeout (float): Seconds to wait for speech to start
+            phrase_time_limit (float): Longest utterance recorded
+            calibration (float): Seconds of background noise measured first
+
+        Returns:
+            sr.AudioData: The utterance without its trailing silence, None if nobody spoke before the timeout
+        """
+        import speech_recognition as sr
+
+        frame_seconds = source.CHUNK / source.SAMPLE_RATE
+        noise = [frame_energy(source.stream.read(source.CHUNK)) for _ in range(max(int(calibration / frame_seconds), 1))]
+        detector = self.detector(language, float(np.median(noise)), frame_seconds)
+
+        frames = []
+        while True:
+            chunk = source.stream.read(source.CHUNK)
+            frames.append(chunk)
+            if detector.push(frame_energy(chunk)):
+                break
+            if detector.speech_start is None and len(frames) * frame_seconds > timeout:
+                return None
+            if detector.speech_start is not None and (len(frames) - detector.speech_start) * frame_seconds > phrase_time_limit:
+                break
+
+        self.observe(language, detector.pauses)
+        start, end = detector.audio_range()
+        return sr.AudioData(b"".join(frames[start:end]), source.SAMPLE_RATE, source.SAMPLE_WIDTH)
+
+def read_wav(path):
+    """Samples and rate of a 16-bit mono WAV file"""
+    with wave.open(str(path), "rb") as f:
+        if f.getsampwidth() != 2 or f.getnchannels() != 1:
+            raise ValueError(f"{path} is not 16-bit mono")
+        return f.readframes(f.getnframes()), f.getframerate()
+
+def detect_end(pcm, rate, detector, frame_size=1024):
+    """Stream a recording through a detector, returns the second at which it declared the end of speech"""
+    for start in range(0, len(pcm), frame_size * 2):
+        if detector.push(frame_energy(pcm[start:start + frame_size * 2])):
+            return detector.frames * frame_size / rate
+    return None
+
+def make_test_set(directory, utterances=120, rate=16000, seed=42):
+    """
+    Write synthetic utterances with known end of speech to directory/*.wav and labels.json.
+
+    Words are bursts of shaped noise. English turns have short gaps between words with the odd
+    hesitation, target-language turns (a beginner) hesitate longer and more often.
+    """
+    rng = random.Random(seed)
+    noise_rng = np.random.default_rng(seed)
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    labels = {}
+    for i in range(utterances):
+        language = "en-US" if i % 2 == 0 else "fr-FR"
+        hesitation_chance, hesitation = (0.1, (0.3, 0.7)) if language == "en-US" else (0.3, (0.6, 1.6))
+        noise_level = rng.uniform(60, 200)
+
+        pieces = [np.zeros(int(rng.uniform(0.3, 1.0) * rate))]
+        longest_pause = 0.0
+        for word in range(rng.randint(3, 10)):
+            if word:
+                gap = rng.uniform(*hesitation) if rng.random() < hesitation_chance else rng.uniform(0.05, 0.25)
+                longest_pause = max(longest_pause, gap)
+                pieces.append(np.zeros(int(gap * rate)))
+            length = int(rng.uniform(0.2, 0.6) * rate)
+            envelope = np.sin(np.linspace(0, np.pi, length)) ** 0.5
+            pieces.append(noise_rng.normal(0, rng.uniform(2000, 5000), length) * envelope)
+        speech_end = sum(len(piece) for piece in pieces) / rate
+        pieces.append(np.zeros(int(3.0 * rate)))
+
+        signal = np.concatenate(pieces)
+        signal += noise_rng.normal(0, noise_level, len(signal))
+        name = f"utterance_{i:03d}.wav"
+        with wave.open(str(directory / name), "wb") as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(rate)
+            f.writeframes(np.clip(signal, -32768, 32767).astype(np.int16).tobytes())
+        labels[name] = {"language": language, "speech_end": speech_end, "longest_pause": longest_pause}
+
+    with open(directory / "labels.json", "w") as f:
+        json.dump(labels, f, indent=2)
+
+def evaluate(directory, calibration=0.25, frame_size=1024):
+    """
+    Compare the fixed 2 s pause threshold with the adaptive endpointer on a labelled WAV set.
+
+    Files are replayed in name order as one session, so the adaptive endpointer learns as it goes.
+    Both use the same energy detector, only the pause threshold differs.
+
+    Returns:
+        dict: method -> language -> list of (detection latency in s, premature cutoff)
+    """
+    directory = Path(directory)
+    with open(directory / "labels.json") as f:
+        labels = json.load(f)
+
+    endpointer = AdaptiveEndpointer()
+    results = {"fixed": {}, "adaptive": {}}
+    for name in sorted(labels):
+        label = labels[name]
+        pcm, rate = read_wav(directory / name)
+        frame_seconds = frame_size / rate
+        calibration_bytes = int(calibration * rate) * 2
+        noise_floor = float(np.median([frame_energy(pcm[i:i + frame_size * 2])
+                                       for i in range(0, calibration_bytes, frame_size * 2)]))
+
+        for method in results:
+            if method == "fixed":
+                detector = UtteranceDetector(FIXED_PAUSE, noise_floor, frame_seconds)
+            else:
+                detector = endpointer.detector(label["language"], noise_floor, frame_seconds)
+            detected = detect_end(pcm, rate, detector, frame_size)
+            if detected is None:
+                detected = len(pcm) / 2 / rate
+            if method == "adaptive":
+                endpointer.observe(label["language"], detector.pauses)
+            results[method].setdefault(label["language"], []).append(
+                (detected - label["speech_end"], detected < label["speech_end"]))
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="End-of-speech latency and premature cutoffs: adaptive endpointing vs a fixed 2 s pause")
+    parser.add_argument("--wav-dir", help="directory with 16-bit mono WAVs and labels.json (default: a synthetic set)")
+    parser.add_argument("--utterances", type=int, default=120, help="size of the synthetic set")
+    args = parser.parse_args()
+
+    if args.wav_dir:
+        results = evaluate(args.wav_dir)
+    else:
+        import tempfile
+        with tempfile.TemporaryDirectory() as tmp:
+            make_test_set(tmp, args.utterances)
+            results = evaluate(tmp)
+
+    print(f"{'method':<9} {'language':<9} {'turns':>5} {'mean latency':>13} {'p95 latency':>12} {'premature':>10}")
+    for method, by_language in results.items():
+        for language, outcomes in sorted(by_language.items()):
+            latencies = np.array([latency for latency, premature in outcomes if not premature])
+            premature = np.mean([premature for _, premature in outcomes])
+            mean = latencies.mean() if len(latencies) else float("nan")
+            p95 = np.percentile(latencies, 95) if len(latencies) else float("nan")
+            print(f"{method:<9} {language:<9} {len(outcomes):>5} {mean:>12.2f}s {p95:>11.2f}s {premature:>10.1%}")
+    sys.stdout.flush()
@@ -0,0 +1,216 @@
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = ["bonjour", "merci", "hello", "culture", "food", "tradition", "language", "friend", "today", "yes"]
+
+class _FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real server
+
+    def log_message(self, format, *args):
+        pass  # keep the benchmark output readable
+
+    def setup(self):
+        super().setup()
+        self.server.record_connection()
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, payload):
+        data = (json.dumps(payload) + "\n").encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json(200, {"models": [{"name": "llama2"}]})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/api/generate":
+            self._send_json(404, {"error": "not found"})
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        num_predict = request.get("options", {}).get("num_predict") or self.server.tokens
+        num_tokens = min(num_predict, self.server.tokens) if request.get("prompt") else 0
+
+        self.server.record_generation(1)
+        try:
+            self._generate(request, num_tokens)
+        finally:
+            self.server.record_generation(-1)
+
+    def _generate(self, request, num_tokens):
+        with self.server.generation_slots:
+            time.sleep(self.server.latency)  # prompt evaluation / time to first token
+            tokens = [random.choice(WORDS) + " " for _ in range(num_tokens)]
+
+            if not request.get("stream", True):
+                time.sleep(num_tokens / self.server.token_rate)
+                self._send_json(200, {"model": request.get("model"), "response": "".join(tokens), "done": True})
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for token in tokens:
+                time.sleep(1 / self.server.token_rate)
+                self._write_chunk({"model": request.get("model"), "response": token, "done": False})
+            self._write_chunk({"model": request.get("model"), "response": "", "done": True})
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+
+class FakeOllamaServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.05, token_rate=200.0, tokens=20, parallel=4):
+        """
+        Minimal stand-in for the Ollama HTTP API (/api/generate and /api/tags).
+
+        Args:
+            host (str): Interface to bind to
+            port (int): Port to bind to (0 picks a free one)
+            latency (float): Seconds before the first token of every generation
+            token_rate (float): Tokens generated per second
+            tokens (int): Maximum tokens per reply (also capped by num_predict)
+            parallel (int): Generations served at once, like OLLAMA_NUM_PARALLEL
+        """
+        super().__init__((host, port), _FakeOllamaHandler)
+        self.latency = latency
+        self.token_rate = token_rate
+        self.tokens = tokens
+        self.generation_slots = threading.BoundedSemaphore(parallel)
+        self.connections = 0
+        self.in_flight = 0
+        self.max_in_flight = 0 # most generations requested at the same time, whether or not a slot was free
+        self._connections_lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def record_connection(self):
+        with self._connections_lock:
+            self.connections += 1
+
+    def record_generation(self, change):
+        with self._connections_lock:
+            self.in_flight += change
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, name="fake-ollama", daemon=True)
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+def check_gateway(latencies, connections, max_in_flight, concurrency):
+    """
+    What the gateway must guarantee under load, returns a list of failures (empty if all hold).
+
+    Args:
+        latencies (dict): 'interactive' and 'background' -> request latencies in seconds
+        connections (int): TCP connections the server accepted
+        max_in_flight (int): Most generations the server saw at once
+        concurrency (int): The gateway's concurrency cap
+    """
+    failures = []
+    interactive, background = sorted(latencies["interactive"]), sorted(latencies["background"])
+    if interactive and background and interactive[len(interactive) // 2] >= background[len(background) // 2]:
+        failures.append(f"interactive requests did not finish ahead of background ones (p50 "
+                        f"{interactive[len(interactive) // 2] * 1000:.0f}ms vs {background[len(background) // 2] * 1000:.0f}ms)")
+    if connections > concurrency:
+        failures.append(f"{connections} connections opened for a concurrency cap of {concurrency}")
+    if max_in_flight > concurrency:
+        failures.append(f"{max_in_flight} generations in flight for a concurrency cap of {concurrency}")
+    return failures
+
+def _throughput_benchmark(args):
+    """Drive the gateway with many concurrent callers, report throughput and queueing and check the gateway's guarantees"""
+    from concurrent.futures import ThreadPoolExecutor
+    from llm_gateway import OllamaGateway, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
+
+    server = FakeOllamaServer(latency=args.latency, token_rate=args.token_rate,
+                              tokens=args.tokens, parallel=args.parallel).start()
+    gateway = OllamaGateway(base_url=server.url, max_concurrency=args.concurrency, timeout=30)
+
+    latencies = {"interactive": [], "background": []}
+    max_depth = 0
+
+    def one_request(i):
+        nonlocal max_depth
+        priority = PRIORITY_BACKGROUND if i % 4 == 0 else PRIORITY_INTERACTIVE
+        start = time.perf_counter()
+        gateway.generate(f"prompt {i}", "llama2", num_predict=args.tokens, priority=priority)
+        latencies["background" if priority == PRIORITY_BACKGROUND else "interactive"].append(time.perf_counter() - start)
+        max_depth = max(max_depth, gateway.stats()["queue_depth"])
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.clients) as executor:
+        list(executor.map(one_request, range(args.requests)))
+    elapsed = time.perf_counter() - start
+
+    stats = gateway.stats()
+    print(f"{args.requests} requests from {args.clients} clients in {elapsed:.2f}s "
+          f"({args.requests / elapsed:.1f} req/s)")
+    for name in ["interactive", "background"]:
+        values = sorted(latencies[name])
+        if values:
+            print(f"  {name:<12} n={len(values):<5} p50={values[len(values) // 2] * 1000:.0f}ms "
+                  f"p95={values[int(len(values) * 0.95)] * 1000:.0f}ms")
+    print(f"  max queue depth={max_depth}, wait p95={stats['wait_ms_p95']:.0f}ms, "
+          f"TCP connections opened={server.connections}, max generations in flight={server.max_in_flight}, "
+          f"failed={stats['failed']}")
+
+    gateway.close()
+    server.stop()
+
+    failures = check_gateway(latencies, server.connections, server.max_in_flight, args.concurrency)
+    if stats["failed"]:
+        failures.append(f"{stats['failed']} requests failed")
+    for failure in failures:
+        print(f"FAIL: {failure}", flush=True)
+    return not failures
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Ollama server and gateway throughput benchmark")
+    parser.add_argument("--serve", action="store_true", help="only run the fake server (e.g. on port 11434)")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds to first token")
+    parser.add_argument("--token-rate", type=float, default=200.0, help="tokens per second")
+    parser.add_argument("--tokens", type=int, default=20, help="tokens per reply")
+    parser.add_argument("--parallel", type=int, default=4, help="generations the server runs at once")
+    parser.add_argument("--concurrency", type=int, default=2, help="gateway concurrency cap")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    if args.serve:
+        server = FakeOllamaServer(port=args.port, latency=args.latency, token_rate=args.token_rate,
+                                  tokens=args.tokens, parallel=args.parallel)
+        print(f"Fake Ollama listening on {server.url}", flush=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.server_close()
+    else:
+        sys.exit(0 if _throughput_benchmark(args) else 1)
@@ -0,0 +1,134 @@
+import os
+import re
+import json
+import tempfile
+import pandas as pd
+
+from pipeline import file_hash
+
+# Raw exports live in data/, parsed copies in .cache/analysis/ (safe to delete at any time)
+DATA_DIR = "data"
+CACHE_DIR = os.path.join(".cache", "analysis")
+
+LIKERT_SCALE = {
+    "Strongly Disagree": 1,
+    "Disagree": 2,
+    "Neither agree nor disagree": 3,
+    "Agree": 4,
+    "Strongly agree": 5
+}
+
+# Filler words removed before counting the languages a participant listed
+LANGUAGE_FILLER = re.compile(r'\b(native|a bit of|a bit|is my native langauge|is my|is|and some|and|language)\b', re.IGNORECASE)
+
+try:
+    import pyarrow  # noqa: F401
+    CACHE_FORMAT = "parquet"
+except ImportError:
+    CACHE_FORMAT = "pickle"
+
+# Parsed frames are also kept in memory so repeated loads within one run never touch the disk
+_frames = {}
+
+# One small JSON entry per source file (size, mtime, hash, format of its cached copy). Pipeline tasks
+# run in parallel processes, so there is no shared manifest for them to overwrite each other's entries in.
+def _entry_path(cache_dir, name):
+    return os.path.join(cache_dir, f"{os.path.splitext(name)[0]}.json")
+
+def _load_entry(cache_dir, name):
+    try:
+        with open(_entry_path(cache_dir, name)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_entry(cache_dir, name, entry):
+    # a temporary file of its own, so two processes caching the same file do not replace each other's
+    fd, tmp = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(entry, f, indent=2)
+    os.replace(tmp, _entry_path(cache_dir, name))
+
+def _write_cache(df, path):
+    # written next to the cache file and swapped in, so a parallel task never reads it half written
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    os.close(fd)
+    if CACHE_FORMAT == "parquet":
+        df.to_parquet(tmp, index=False)
+    else:
+        df.to_pickle(tmp)
+    os.replace(tmp, path)
+
+def _read_cache(path):
+    if CACHE_FORMAT == "parquet":
+        return pd.read_parquet(path)
+    return pd.read_pickle(path)
+
+def read_csv_cached(name, data_dir=DATA_DIR, cache_dir=CACHE_DIR):
+    """
+    Return the raw CSV data/<name> as a DataFrame, parsing it at most once per change of the file.
+
+    A cached copy is reused while the file's size and mtime are unchanged. If they changed but
+    the content hash did not (e.g. the file was touched or copied) the cache is reused as well.
+    """
+    source = os.path.join(data_dir, name)
+    stat = os.stat(source)
+    key = (source, stat.st_size, stat.st_mtime_ns)
+    if key in _frames:
+        return _frames[key].copy()
+
+    os.makedirs(cache_dir, exist_ok=True)
+    entry = _load_entry(cache_dir, name)
+    cache_file = os.path.join(cache_dir, f"{os.path.splitext(name)[0]}.{CACHE_FORMAT}")
+
+    df = None
+    if os.path.exists(cache_file) and entry.get("format") == CACHE_FORMAT:
+        fresh = entry.get("size") == stat.st_size and entry.get("mtime_ns") == stat.st_mtime_ns
+        if not fresh and entry.get("sha1") == file_hash(source):
+            entry.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+            _save_entry(cache_dir, name, entry)
+            fresh = True
+        if fresh:
+            df = _read_cache(cache_file)
+
+    if df is None:
+        df = pd.read_csv(source)
+        _write_cache(df, cache_file)
+        _save_entry(cache_dir, name, {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha1": file_hash(source),
+            "format": CACHE_FORMAT
+        })
+
+    _frames[key] = df
+    return df.copy()
+
+def fill_missing_pairs(memory_df, no_memory_df):
+    """
+    Give every participant a row in both conditions: an ID missing from one condition
+    gets that condition's mean score.
+    """
+    missing_no_memory = memory_df.loc[~memory_df['ID'].isin(no_memory_df['ID']), 'ID'].unique()
+    missing_memory = no_memory_df.loc[~no_memory_df['ID'].isin(memory_df['ID']), 'ID'].unique()
+
+    no_memory_fill = pd.DataFrame({'ID': missing_no_memory, 'Score': no_memory_df['Score'].mean(), 'Memory': 0})
+    memory_fill = pd.DataFrame({'ID': missing_memory, 'Score': memory_df['Score'].mean(), 'Memory': 1})
+
+    # skip empty fills, concatenating an empty frame can change the column dtypes
+    if len(no_memory_fill):
+        no_memory_df = pd.concat([no_memory_df, no_memory_fill], ignore_index=True)
+    if len(memory_fill):
+        memory_df = pd.concat([memory_df, memory_fill], ignore_index=True)
+    return memory_df, no_memory_df
+
+def likert_to_scores(df, columns):
+    """Map Likert answers to 1-5 for the given columns at once (unknown answers become NaN)"""
+    df[columns] = df[columns].apply(lambda column: column.map(LIKERT_SCALE)).astype(float)
+    return df
+
+def count_languages_series(series):
+    """Number of languages listed per answer, 0 for missing answers"""
+    cleaned = series.astype("string").str.replace(LANGUAGE_FILLER, "", regex=True).str.replace("-", " ", regex=False)
+    # a language is any run of characters between commas and whitespace
+    return cleaned.str.count(r"[^,\s]+").fillna(0).astype(int)
@@ -0,0 +1,294 @@
+import os
+import sys
+import json
+import time
+import heapq
+import itertools
+import threading
+import http.client
+
+from collections import deque
+from urllib.parse import urlsplit
+from langchain_core.runnables import RunnableLambda
+
+OLLAMA_PORT = 11434
+
+def ollama_url(host):
+    """
+    Server address from an OLLAMA_HOST value, read the way the Ollama CLI does: without a scheme the
+    port defaults to 11434 (80 or 443 with http:// or https://), and 0.0.0.0 (the server listening on
+    every interface) is reached over loopback.
+    """
+    host = host.strip()
+    if "://" in host:
+        url = urlsplit(host)
+        default_port = 443 if url.scheme == "https" else 80
+    else:
+        url = urlsplit(f"http://{host}")
+        default_port = OLLAMA_PORT
+    hostname = url.hostname or "127.0.0.1"
+    if hostname in ("0.0.0.0", "::"):
+        hostname = "127.0.0.1"
+    if ":" in hostname:
+        hostname = f"[{hostname}]"
+    return f"{url.scheme}://{hostname}:{url.port or default_port}{url.path.rstrip('/')}"
+
+# Same variable the Ollama CLI reads, e.g. OLLAMA_HOST=127.0.0.1:11434 or OLLAMA_HOST=0.0.0.0
+OLLAMA_URL = ollama_url(os.environ.get("OLLAMA_HOST", "127.0.0.1:11434"))
+
+# Lower numbers are served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+
+class GatewayError(Exception):
+    """Raised when Ollama cannot produce a generation (after retries)"""
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status # HTTP status returned by Ollama, if any
+
+class _PrioritySlots:
+    """Counting semaphore that hands out free slots to the highest priority waiter first"""
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_flight = 0
+        self._waiting = []  # heap of (priority, seq)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    @property
+    def depth(self):
+        return len(self._waiting)
+
+    def acquire(self, priority, timeout=None):
+        """Block until a slot is free and this caller is first in line. Returns the wait in seconds."""
+        start = time.perf_counter()
+        ticket = (priority, next(self._seq))
+        with self._cond:
+            heapq.heappush(self._waiting, ticket)
+            try:
+                ready = self._cond.wait_for(
+                    lambda: self.in_flight < self.limit and self._waiting[0] == ticket,
+                    timeout=timeout
+                )
+                if not ready:
+                    raise GatewayError(f"Timed out after {timeout}s waiting for a free generation slot")
+            finally:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                # the head of the queue may have changed, let the next waiter re-check
+                self._cond.notify_all()
+            self.in_flight += 1
+        return time.perf_counter() - start
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+class _ConnectionPool:
+    """Keeps idle HTTP/1.1 connections to Ollama around so requests skip the TCP (and TLS) handshake"""
+    def __init__(self, host, port, timeout, max_idle, https=False):
+        self.host = host
+        self.port = port
+        self.connection_class = http.client.HTTPSConnection if https else http.client.HTTPConnection
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.opened = 0
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def get(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+            self.opened += 1
+        return self.connection_class(self.host, self.port, timeout=self.timeout)
+
+    def put(self, conn):
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+class OllamaGateway:
+    def __init__(self, base_url=OLLAMA_URL, max_concurrency=2, timeout=120, retries=2,
+                 backoff=0.5, keep_alive="30m", queue_timeout=None):
+        """
+        Shared entry point for every generation sent to the local Ollama server.
+
+        Args:
+            base_url (str): Address of the Ollama server
+            max_concurrency (int): Maximum number of generations running at once, the rest are queued
+            timeout (float): Socket timeout in seconds for connecting and for each streamed read
+            retries (int): How many times a failed request is retried before any token was received
+            backoff (float): Base delay in seconds between retries (doubled on every attempt)
+            keep_alive (str): How long Ollama should keep the model loaded after a request
+            queue_timeout (float): Maximum time in seconds a request may wait for a slot (None waits forever)
+        """
+        url = urlsplit(base_url)
+        self.base_url = base_url
+        # Ollama behind a reverse proxy can live under a path, e.g. https://host/ollama
+        self.generate_path = url.path.rstrip("/") + "/api/generate"
+        self.retries = retries
+        self.backoff = backoff
+        self.keep_alive = keep_alive
+        self.queue_timeout = queue_timeout
+
+        self._slots = _PrioritySlots(max_concurrency)
+        https = url.scheme == "https"
+        self._pool = _ConnectionPool(url.hostname, url.port or (443 if https else OLLAMA_PORT), timeout,
+                                     max_idle=max_concurrency, https=https)
+
+        self._stats_lock = threading.Lock()
+        self._wait_times = deque(maxlen=1000)
+        self._counters = {"completed": 0, "failed": 0, "retried": 0}
+
+    def _post(self, conn, payload):
+        body = json.dumps(payload).encode("utf-8")
+        conn.request("POST", self.generate_path, body=body, headers={"Content-Type": "application/json"})
+        response = conn.getresponse()
+        if response.status != 200:
+            detail = response.read().decode("utf-8", errors="replace")
+            raise GatewayError(f"Ollama returned HTTP {response.status}: {detail}", status=response.status)
+        return response
+
+    def _count(self, key):
+        with self._stats_lock:
+            self._counters[key] += 1
+
+    def stream(self, prompt, model, num_predict=None, priority=PRIORITY_INTERACTIVE):
+        """Yield the generated text piece by piece while holding one generation slot"""
+        payload = {
+            "model": model,
+            "prompt": prompt,
+            "stream": True,
+            "keep_alive": self.keep_alive,
+        }
+        if num_predict is not None:
+            payload["options"] = {"num_predict": num_predict}
+
+        waited = self._slots.acquire(priority, timeout=self.queue_timeout)
+        with self._stats_lock:
+            self._wait_times.append(waited)
+
+        try:
+            attempt = 0
+            while True:
+                conn = self._pool.get()
+                received = False
+                reusable = False
+                try:
+                    response = self._post(conn, payload)
+                    for line in response:
+                        if not line.strip():
+                            continue
+                        chunk = json.loads(line)
+                        if "error" in chunk:
+                            raise GatewayError(f"Ollama error: {chunk['error']}")
+                        if chunk.get("response"):
+                            received = True
+                            yield chunk["response"]
+                        if chunk.get("done"):
+                            break
+                    response.read()  # drain the terminating chunk so the connection can be reused
+                    reusable = True
+                    self._count("completed")
+                    return
+                except (OSError, http.client.HTTPException, GatewayError) as e:
+                    # Only retry when nothing has been handed to the caller yet, and never client errors
+                    # (e.g. 404 for a model that is not pulled) since those fail the same way again
+                    client_error = isinstance(e, GatewayError) and e.status is not None and 400 <= e.status < 500
+                    if received or client_error or attempt >= self.retries:
+                        self._count("failed")
+                        if isinstance(e, GatewayError):
+                            raise
+                        raise GatewayError(f"Request to Ollama failed: {e}") from e
+                    attempt += 1
+                    self._count("retried")
+                    time.sleep(self.backoff * 2 ** (attempt - 1))
+                finally:
+                    if reusable:
+                        self._pool.put(conn)
+                    else:
+                        conn.close()
+        finally:
+            self._slots.release()
+
+    def generate(self, prompt, model, num_predict=None, priority=PRIORITY_INTERACTIVE):
+        """Return the full generation as a single string"""
+        return "".join(self.stream(prompt, model, num_predict=num_predict, priority=priority))
+
+    def warm_up(self, model, background=True, on_failure=None):
+        """
+        Ask Ollama to load the model (an empty prompt only loads it) so the first turn is not a cold start.
+
+        Args:
+            model (str): Model to load
+            background (bool): Load from a daemon thread instead of blocking
+            on_failure (callable): Called with the GatewayError if the model could not be loaded
+        """
+        def _load():
+            try:
+                self.generate("", model, priority=PRIORITY_BACKGROUND)
+            except GatewayError as e:
+                print(f"Warm-up of {model} failed: {e}", file=sys.stderr, flush=True)
+                if on_failure is not None:
+                    on_failure(e)
+
+        if not background:
+            _load()
+            return None
+        thread = threading.Thread(target=_load, name=f"warm-up-{model}", daemon=True)
+        thread.start()
+        return thread
+
+    def as_runnable(self, model, num_predict=None, priority=PRIORITY_INTERACTIVE):
+        """Wrap the gateway as a LangChain runnable that can replace an OllamaLLM in a chain"""
+        def _call(prompt_value):
+            prompt = prompt_value if isinstance(prompt_value, str) else prompt_value.to_string()
+            yield from self.stream(prompt, model, num_predict=num_predict, priority=priority)
+
+        return RunnableLambda(_call, name=f"ollama-{model}")
+
+    def stats(self):
+        """Snapshot of queue depth, concurrency and wait times (in milliseconds)"""
+        with self._stats_lock:
+            waits = sorted(self._wait_times)
+            counters = dict(self._counters)
+
+        def percentile(p):
+            if not waits:
+                return 0.0
+            return waits[min(len(waits) - 1, int(p * len(waits)))] * 1000
+
+        return {
+            "queue_depth": self._slots.depth,
+            "in_flight": self._slots.in_flight,
+            "max_concurrency": self._slots.limit,
+            "connections_opened": self._pool.opened,
+            "wait_ms_avg": sum(waits) / len(waits) * 1000 if waits else 0.0,
+            "wait_ms_p95": percentile(0.95),
+            "wait_ms_max": waits[-1] * 1000 if waits else 0.0,
+            **counters,
+        }
+
+    def close(self):
+        self._pool.close()
+
+_shared_gateway = None
+_shared_lock = threading.Lock()
+
+def get_gateway(**kwargs):
+    """Return the process-wide gateway, creating it on first use (later kwargs are ignored)"""
+    global _shared_gateway
+    with _shared_lock:
+        if _shared_gateway is None:
+            _shared_gateway = OllamaGateway(**kwargs)
+        return _shared_gateway
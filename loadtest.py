@@ -0,0 +1,315 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import traceback
+import multiprocessing
+import numpy as np
+
+from queue import Empty
+from pathlib import Path
+from fake_ollama import FakeOllamaServer
+
+REPO_DIR = Path(__file__).resolve().parent
+SAMPLE_INTERVAL = 0.5 # seconds between /proc samples of the learner processes
+
+# Building blocks for random dialogues: short drill-like turns and open-ended ones
+SHORT_TURNS = ["hello", "thanks!", "ok", "yes", "how do you say {meaning}?", "what does {word} mean", "repeat that please"]
+OPEN_TURNS = [
+    "Can you tell me about a tradition from your country?",
+    "Why is {word} important when travelling?",
+    "Explain the difference between {word} and {other}",
+    "My friend {friend} is visiting {city} next week, what should we eat?",
+    "I practised {word} today, did I use it right in this sentence: {word} please?"
+]
+FRIENDS = ["Pierre", "Yuki", "Lena", "Carlos", "Amira", "Tom"]
+CITIES = ["Paris", "Kyoto", "Berlin", "Sevilla", "Chicago", "Lyon"]
+
+def random_dialogue(profile, turns, rng):
+    """A learner's turns, mixing short drills with open questions about the culture's words_to_learn"""
+    words = profile["words_to_learn"]
+    dialogue = []
+    for _ in range(turns):
+        pair, other = rng.sample(words, 2)
+        template = rng.choice(SHORT_TURNS if rng.random() < 0.4 else OPEN_TURNS)
+        dialogue.append(template.format(word=pair["word"].replace("__", "").strip(), meaning=pair["meaning"],
+                                        other=other["word"], friend=rng.choice(FRIENDS), city=rng.choice(CITIES)))
+    return dialogue
+
+def _learner(index, culture, dialogue, options, ready, go, results):
+    """One simulated learner: a full CulturalPenPal in its own process, like one GUI session"""
+    try:
+        # every learner gets its own data directory and debug.log (penpal redirects stderr on import)
+        workdir = Path(options["workdir"]) / f"learner_{index}"
+        workdir.mkdir(parents=True, exist_ok=True)
+        if not (workdir / "cultures").exists():
+            os.symlink(REPO_DIR / "cultures", workdir / "cultures")
+        os.chdir(workdir)
+        sys.path.insert(0, str(REPO_DIR))
+
+        if options["low_memory"]:
+            from low_memory import skip_torch
+            skip_torch()
+        from penpal import CulturalPenPal
+        from protocol import NullChannel
+
+        start = time.perf_counter()
+        with open(REPO_DIR / "cultures" / "culture_profiles.json") as f:
+            name = json.load(f)[culture]["name"]
+        pen_pal = CulturalPenPal(name=name, culture=culture, channel=NullChannel(), persistence_dir="pen_pal_data",
+                                 low_memory=options["low_memory"])
+        ready.put((index, time.perf_counter() - start, None))
+        go.wait()
+
+        rng = random.Random(index)
+        latencies = []
+        for user_input in dialogue:
+            turn_start = time.perf_counter()
+            pen_pal.respond(user_input)
+            latencies.append(time.perf_counter() - turn_start)
+            if options["think_time"] > 0:
+                time.sleep(rng.expovariate(1 / options["think_time"]))
+        results.put((index, latencies, None))
+    except Exception:
+        error = traceback.format_exc()
+        ready.put((index, None, error))
+        results.put((index, [], error))
+
+def _proc_stats(pid):
+    """(cpu seconds, rss MB, open fds) of a process from /proc, None if it is gone"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        cpu = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+        with open(f"/proc/{pid}/status") as f:
+            rss = next((int(line.split()[1]) / 1024 for line in f if line.startswith("VmRSS:")), 0.0)
+        fds = len(os.listdir(f"/proc/{pid}/fd"))
+        return cpu, rss, fds
+    except (OSError, IndexError, ValueError):
+        return None
+
+def _collect(messages, processes, interval=SAMPLE_INTERVAL):
+    """
+    Yields the (index, value, error) message of every learner without blocking on learners that died
+    (e.g. OOM-killed) before reporting: those yield (index, None, None) once the queue stays empty after they exited.
+
+    Args:
+        messages: queue the learners put their messages on
+        processes: learner processes, by index
+        interval: seconds to wait for a message before checking which learners are still alive
+    """
+    pending = set(range(len(processes)))
+    while pending:
+        exited = {index for index in pending if processes[index].exitcode is not None}
+        try:
+            index, value, error = messages.get(timeout=interval)
+        except Empty:
+            # anything an exited learner put on the queue was flushed before it exited
+            for index in sorted(exited):
+                pending.discard(index)
+                yield index, None, None
+            continue
+        pending.discard(index)
+        yield index, value, error
+
+class ProcessSampler:
+    def __init__(self, pids, interval=SAMPLE_INTERVAL):
+        """Samples CPU time, RSS and open file descriptors of the learner processes in a background thread"""
+        self.pids = list(pids)
+        self.interval = interval
+        self.cpu = {}
+        self.peak_rss = 0.0
+        self.peak_fds = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampler", daemon=True)
+
+    def _sample(self):
+        rss = fds = 0
+        for pid in self.pids:
+            stats = _proc_stats(pid)
+            if stats is not None:
+                self.cpu[pid] = stats[0]
+                rss += stats[1]
+                fds += stats[2]
+        self.peak_rss = max(self.peak_rss, rss)
+        self.peak_fds = max(self.peak_fds, fds)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self._sample()
+        self.cpu_start = dict(self.cpu)
+        self.wall_start = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._sample()
+        self._stop.set()
+        self._thread.join()
+        # CPU used while the turns ran, as a percentage of one core
+        used = sum(self.cpu[pid] - self.cpu_start.get(pid, 0.0) for pid in self.cpu)
+        return used / max(time.perf_counter() - self.wall_start, 1e-9) * 100
+
+def run_level(n_learners, culture_profiles, options):
+    """Run n learners at once and measure turn latency, throughput and resource use"""
+    ctx = multiprocessing.get_context("spawn")
+    ready, results, go = ctx.Queue(), ctx.Queue(), ctx.Event()
+    cultures = list(culture_profiles)
+    rng = random.Random(options["seed"] + n_learners)
+
+    processes = []
+    for i in range(n_learners):
+        culture = cultures[i % len(cultures)]
+        dialogue = options["script"] or random_dialogue(culture_profiles[culture], options["turns"], rng)
+        process = ctx.Process(target=_learner, args=(i, culture, dialogue, options, ready, go, results), daemon=True)
+        process.start()
+        processes.append(process)
+
+    startups = []
+    died = []
+    for index, startup, error in _collect(ready, processes):
+        if error:
+            for process in processes:
+                process.terminate()
+            raise RuntimeError(f"Learner {index} failed to start:\n{error}")
+        if startup is None:
+            died.append(index)
+        else:
+            startups.append(startup)
+    if died:
+        # a learner killed while starting up (usually out of memory) means this level cannot be served at all
+        _report_died(died, processes)
+        for process in processes:
+            process.terminate()
+            process.join()
+        return _level_result(n_learners, [], 1.0, float("nan"), 0.0, 0, startups, len(died))
+
+    sampler = ProcessSampler([process.pid for process in processes]).start()
+    start = time.perf_counter()
+    go.set()
+    latencies = []
+    for index, learner_latencies, error in _collect(results, processes):
+        if learner_latencies is None:
+            died.append(index)
+        elif error:
+            print(f"Learner {index} failed:\n{error}", file=sys.stderr, flush=True)
+        else:
+            latencies += learner_latencies
+    elapsed = time.perf_counter() - start
+    cpu = sampler.stop()
+    for process in processes:
+        process.join()
+    _report_died(died, processes)
+    return _level_result(n_learners, latencies, elapsed, cpu, sampler.peak_rss, sampler.peak_fds, startups, len(died))
+
+def _report_died(died, processes):
+    for index in died:
+        print(f"Learner {index} died without reporting (exit code {processes[index].exitcode})", file=sys.stderr, flush=True)
+
+def _level_result(n_learners, latencies, elapsed, cpu, rss, fds, startups, failed):
+    """One row of the results table: turn latency percentiles, throughput and resource use of a level"""
+    latencies_ms = np.array(latencies) * 1000
+    percentile = lambda q: float(np.percentile(latencies_ms, q)) if len(latencies_ms) else float("nan")
+    return {
+        "learners": n_learners,
+        "turns": len(latencies),
+        "throughput": len(latencies) / elapsed,
+        "p50_ms": percentile(50),
+        "p95_ms": percentile(95),
+        "p99_ms": percentile(99),
+        "cpu_percent": cpu,
+        "rss_mb": rss,
+        "rss_per_learner_mb": rss / n_learners,
+        "fds": fds,
+        "startup_s": float(np.median(startups)) if startups else float("nan"),
+        "failed": failed
+    }
+
+def saturated(result, baseline, latency_factor, previous=None):
+    """
+    A level is saturated once a learner died, p95 latency grew by latency_factor over one learner,
+    or more learners stopped adding throughput
+    """
+    if result["failed"]:
+        return True
+    if result["p95_ms"] > baseline["p95_ms"] * latency_factor:
+        return True
+    return previous is not None and result["throughput"] < previous["throughput"] * 1.05
+
+def find_saturation(levels, culture_profiles, options, latency_factor=2.0):
+    """
+    Step the number of learners up until turn latency degrades.
+
+    Returns:
+        tuple: (results per level, largest number of learners served before saturating)
+    """
+    results = []
+    capacity = None
+    print(f"{'learners':>8} {'turns':>6} {'turns/s':>8} {'p50':>9} {'p95':>9} {'p99':>9} {'CPU':>7} "
+          f"{'RSS':>8} {'RSS/lrn':>8} {'fds':>5} {'startup':>8}", flush=True)
+    for n_learners in levels:
+        result = run_level(n_learners, culture_profiles, options)
+        results.append(result)
+        print(f"{result['learners']:>8} {result['turns']:>6} {result['throughput']:>8.2f} {result['p50_ms']:>7.0f}ms "
+              f"{result['p95_ms']:>7.0f}ms {result['p99_ms']:>7.0f}ms {result['cpu_percent']:>6.0f}% "
+              f"{result['rss_mb']:>6.0f}MB {result['rss_per_learner_mb']:>6.0f}MB {result['fds']:>5} "
+              f"{result['startup_s']:>7.1f}s", flush=True)
+        if saturated(result, results[0], latency_factor, results[-2] if len(results) > 1 else None):
+            died = f" ({result['failed']} learners died)" if result["failed"] else ""
+            print(f"Saturated at {n_learners} learners{died}", flush=True)
+            break
+        capacity = n_learners
+    print(f"Capacity: {capacity} simultaneous learners before turn latency degrades", flush=True)
+    return results, capacity
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test: N simulated learners against a fake LLM, stepped up until saturation "
+                                                 "(Linux only, CPU, RSS and file descriptors are read from /proc)")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64],
+                        help="numbers of simultaneous learners to try, in order")
+    parser.add_argument("--turns", type=int, default=10, help="turns per learner in random dialogues")
+    parser.add_argument("--script", help="file with one user turn per line, replayed by every learner instead of random dialogues")
+    parser.add_argument("--think-time", type=float, default=1.0, help="mean seconds a learner waits between turns")
+    parser.add_argument("--latency", type=float, default=0.2, help="fake LLM seconds to first token")
+    parser.add_argument("--token-rate", type=float, default=30.0, help="fake LLM tokens per second")
+    parser.add_argument("--tokens", type=int, default=60, help="fake LLM tokens per reply")
+    parser.add_argument("--parallel", type=int, default=4, help="generations the fake LLM serves at once")
+    parser.add_argument("--latency-factor", type=float, default=2.0,
+                        help="saturated once p95 latency exceeds this multiple of the single-learner p95")
+    parser.add_argument("--low-memory", action="store_true", help="run the learners in low-memory mode")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--csv", help="also write the per-level results to this CSV file")
+    args = parser.parse_args()
+    if not sys.platform.startswith("linux"):
+        parser.error("the learner processes are sampled from /proc, which is only available on Linux")
+
+    with open(REPO_DIR / "cultures" / "culture_profiles.json") as f:
+        culture_profiles = json.load(f)
+    script = None
+    if args.script:
+        with open(args.script, encoding="utf-8") as f:
+            script = [line.strip() for line in f if line.strip()]
+
+    server = FakeOllamaServer(latency=args.latency, token_rate=args.token_rate, tokens=args.tokens, parallel=args.parallel).start()
+    # the learners' gateways read OLLAMA_HOST when they start
+    os.environ["OLLAMA_HOST"] = server.url
+
+    with tempfile.TemporaryDirectory() as workdir:
+        options = {"workdir": workdir, "turns": args.turns, "script": script, "think_time": args.think_time,
+                   "low_memory": args.low_memory, "seed": args.seed}
+        results, capacity = find_saturation(args.levels, culture_profiles, options, args.latency_factor)
+
+    server.stop()
+    if args.csv:
+        import csv
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(results[0]))
+            writer.writeheader()
+            writer.writerows(results)
@@ -0,0 +1,175 @@
+import os
+import csv
+import sys
+import json
+import time
+import shutil
+import argparse
+
+from pathlib import Path
+from datetime import datetime, timedelta
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from conversation_log import iter_log_turns
+from vocabulary import WordMatcher
+
+# A pause longer than this between two turns starts a new session
+SESSION_GAP_MINUTES = 30
+
+SESSION_COLUMNS = [
+    "Culture", "Session", "Start", "End", "Duration_s", "Turns",
+    "Mean_Turn_Gap_s", "Max_Turn_Gap_s", "Mean_User_Chars", "Mean_Response_Chars",
+    "Words_Exposed", "Words_Used"
+]
+VOCABULARY_COLUMNS = ["Culture", "Session", "Word_Culture", "Word", "Exposed", "Used"]
+
+def log_cultures(culture_profiles):
+    """Map the pen pal name used in a log file name to its culture, e.g. 'sophie' -> 'French'"""
+    return {profile["name"].lower(): culture for culture, profile in culture_profiles.items()}
+
+class SessionStats:
+    def __init__(self, culture, number, start):
+        self.culture = culture
+        self.number = number
+        self.start = self.end = start
+        self.turns = 0
+        # time between consecutive turns (the log has one timestamp per turn, so this includes the learner's
+        # think time and is not the pen pal's response latency)
+        self.turn_gaps = []
+        self.user_chars = 0
+        self.response_chars = 0
+        self.exposed = Counter()
+        self.used = Counter()
+
+    def add(self, timestamp, user, response, matcher):
+        if self.turns:
+            self.turn_gaps.append((timestamp - self.end).total_seconds())
+        self.end = timestamp
+        self.turns += 1
+        self.user_chars += len(user)
+        self.response_chars += len(response)
+        self.exposed.update(matcher.find(response))
+        self.used.update(matcher.find(user))
+
+    def row(self):
+        return [
+            self.culture, self.number, self.start.isoformat(), self.end.isoformat(),
+            round((self.end - self.start).total_seconds(), 3), self.turns,
+            round(sum(self.turn_gaps) / len(self.turn_gaps), 3) if self.turn_gaps else "",
+            round(max(self.turn_gaps), 3) if self.turn_gaps else "",
+            round(self.user_chars / self.turns, 1), round(self.response_chars / self.turns, 1),
+            sum(self.exposed.values()), sum(self.used.values())
+        ]
+
+    def vocabulary_rows(self, matcher):
+        for index in sorted(set(self.exposed) | set(self.used)):
+            for word_culture, word in matcher.entries[index]:
+                yield [self.culture, self.number, word_culture, word, self.exposed[index], self.used[index]]
+
+def iter_sessions(log_file, culture, matcher, session_gap=timedelta(minutes=SESSION_GAP_MINUTES)):
+    """
+    Stream the sessions of one conversation log. Only the session being built is kept
+    in memory, so the cost is linear in the log size and constant in memory.
+    """
+    session = None
+    for turn in iter_log_turns(log_file):
+        try:
+            timestamp = datetime.fromisoformat(turn["time"])
+        except ValueError:
+            continue
+        if session is None or timestamp - session.end > session_gap:
+            if session is not None:
+                yield session
+            session = SessionStats(culture, session.number + 1 if session else 1, timestamp)
+        session.add(timestamp, turn["user"], turn["response"], matcher)
+    if session is not None:
+        yield session
+
+def _analyze_log(log_file, culture, culture_profiles, session_gap, sessions_path, vocabulary_path):
+    """Write the session and vocabulary rows of one log (without headers), returns (turns, sessions)"""
+    # one matcher over every culture's words, so a pen pal slipping into another culture's vocabulary shows up too
+    matcher = WordMatcher(culture_profiles)
+    turns = sessions = 0
+    with open(sessions_path, "w", newline="", encoding="utf-8") as sessions_file, \
+         open(vocabulary_path, "w", newline="", encoding="utf-8") as vocabulary_file:
+        sessions_writer = csv.writer(sessions_file)
+        vocabulary_writer = csv.writer(vocabulary_file)
+        # rows are written as soon as a session closes
+        for session in iter_sessions(log_file, culture, matcher, session_gap):
+            sessions_writer.writerow(session.row())
+            vocabulary_writer.writerows(session.vocabulary_rows(matcher))
+            turns += session.turns
+            sessions += 1
+    return turns, sessions
+
+def _append(target, part):
+    with open(part, "rb") as f:
+        shutil.copyfileobj(f, target)
+    os.remove(part)
+
+def analyze_logs(log_dir="pen_pal_data", output_dir="output", profiles_file="cultures/culture_profiles.json",
+                 session_gap_minutes=SESSION_GAP_MINUTES, jobs=None):
+    """
+    Write per-session metrics and per-session vocabulary counts for every conversation log.
+
+    Each log is streamed in one pass in its own worker process, so logs of any size go through
+    in constant memory and the cultures are analyzed in parallel.
+
+    Args:
+        log_dir (str): Directory with the <pen pal>_conversations.txt logs
+        output_dir (str): Where to write the CSVs
+        profiles_file (str): Culture profiles with the words_to_learn
+        session_gap_minutes (float): Minutes of silence that end a session
+        jobs (int): Worker processes (default: number of CPUs)
+
+    Returns:
+        tuple: (sessions CSV path, vocabulary CSV path)
+    """
+    with open(profiles_file) as f:
+        culture_profiles = json.load(f)
+    cultures = log_cultures(culture_profiles)
+    gap = timedelta(minutes=session_gap_minutes)
+
+    os.makedirs(output_dir, exist_ok=True)
+    sessions_path = os.path.join(output_dir, "conversation_log_sessions.csv")
+    vocabulary_path = os.path.join(output_dir, "conversation_log_vocabulary.csv")
+    log_files = sorted(Path(log_dir).glob("*_conversations.txt"))
+
+    start = time.perf_counter()
+    total_bytes = sum(log_file.stat().st_size for log_file in log_files)
+    parts = []
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = []
+        for i, log_file in enumerate(log_files):
+            name = log_file.name[:-len("_conversations.txt")]
+            part = (f"{sessions_path}.part{i}", f"{vocabulary_path}.part{i}")
+            parts.append(part)
+            futures.append(executor.submit(_analyze_log, log_file, cultures.get(name, name), culture_profiles, gap, *part))
+        counts = [future.result() for future in futures]
+
+    # stitch the parts together in log order
+    with open(sessions_path, "w", newline="", encoding="utf-8") as sessions_file, \
+         open(vocabulary_path, "w", newline="", encoding="utf-8") as vocabulary_file:
+        csv.writer(sessions_file).writerow(SESSION_COLUMNS)
+        csv.writer(vocabulary_file).writerow(VOCABULARY_COLUMNS)
+    with open(sessions_path, "ab") as sessions_file, open(vocabulary_path, "ab") as vocabulary_file:
+        for sessions_part, vocabulary_part in parts:
+            _append(sessions_file, sessions_part)
+            _append(vocabulary_file, vocabulary_part)
+
+    elapsed = time.perf_counter() - start
+    print(f"Analyzed {sum(t for t, _ in counts)} turns in {sum(s for _, s in counts)} sessions "
+          f"from {len(log_files)} logs ({total_bytes / 1e6:.1f} MB) in {elapsed:.1f}s "
+          f"({total_bytes / 1e6 / max(elapsed, 1e-9):.1f} MB/s)", file=sys.stderr, flush=True)
+    return sessions_path, vocabulary_path
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-session metrics and vocabulary counts from the conversation logs")
+    parser.add_argument("--logs", default="pen_pal_data", help="directory with the *_conversations.txt logs")
+    parser.add_argument("--output", default="output")
+    parser.add_argument("--session-gap", type=float, default=SESSION_GAP_MINUTES,
+                        help="minutes of silence that end a session")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes (default: number of CPUs)")
+    args = parser.parse_args()
+
+    analyze_logs(args.logs, args.output, session_gap_minutes=args.session_gap, jobs=args.jobs)
@@ -0,0 +1,500 @@
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import shutil
+import hashlib
+import argparse
+import importlib.util
+import tempfile
+import threading
+import subprocess
+import numpy as np
+
+from pathlib import Path
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+REPO_DIR = Path(__file__).resolve().parent
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+# int8 ONNX export shipped with the model on the Hugging Face hub (AVX2 kernels run on any recent x86 CPU)
+QUANTIZED_ONNX_FILE = "onnx/model_quint8_avx2.onnx"
+MAX_SEQ_LENGTH = 256 # tokens, like the sentence-transformers config of all-MiniLM-L6-v2
+VECTOR_PRECISIONS = ["float16", "int8"]
+SEARCH_BLOCK = 8192 # stored vectors are widened to float32 this many rows at a time
+ENCODE_BATCH = 8 # chunks embedded at once, the activations of a batch dominate the peak RSS while indexing
+
+def rss_mb():
+    """Current resident set size of this process in MB (NaN where it cannot be read)"""
+    if sys.platform.startswith("linux"):
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 2**20
+    except ImportError:
+        return float("nan")
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB (NaN where it cannot be read)"""
+    if sys.platform == "win32":
+        try:
+            import psutil
+            return psutil.Process().memory_info().peak_wset / 2**20
+        except ImportError:
+            return float("nan")
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+def onnx_available():
+    return all(importlib.util.find_spec(package) is not None for package in ("onnxruntime", "tokenizers"))
+
+def skip_torch():
+    """
+    Keep PyTorch (~600MB) out of a low-memory process. langchain_core imports transformers whenever it is
+    installed, and transformers imports PyTorch unless USE_TORCH is off. Has to run before langchain_core's
+    language models are imported, and does nothing without onnxruntime, where the PyTorch model is the fallback.
+    """
+    if onnx_available():
+        os.environ.setdefault("USE_TORCH", "0")
+        # transformers would otherwise warn that it found no PyTorch
+        os.environ.setdefault("TRANSFORMERS_NO_ADVISORY_WARNINGS", "1")
+
+def _model_dir(model_name, files):
+    """Local directory with the model's files, downloaded from the Hugging Face hub (or its cache) unless model_name is a path"""
+    if Path(model_name).is_dir():
+        return Path(model_name)
+    from huggingface_hub import snapshot_download
+    repo_id = model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+    return Path(snapshot_download(repo_id, allow_patterns=files))
+
+class QuantizedEmbeddings(Embeddings):
+    def __init__(self, model_name=EMBEDDING_MODEL, onnx_file=QUANTIZED_ONNX_FILE):
+        """
+        Sentence embeddings from an int8 model on the CPU.
+
+        Runs the model's int8 ONNX export with onnxruntime and its fast tokenizer (pip install onnxruntime tokenizers),
+        mean-pooled and unit-normalized like the sentence-transformers model, without importing PyTorch.
+        Without onnxruntime the PyTorch model is used with its linear layers dynamically quantized to int8.
+        """
+        if onnx_available():
+            import onnxruntime
+            from tokenizers import Tokenizer
+
+            model_dir = _model_dir(model_name, [onnx_file, "tokenizer.json"])
+            self.tokenizer = Tokenizer.from_file(str(model_dir / "tokenizer.json"))
+            self.tokenizer.enable_truncation(max_length=MAX_SEQ_LENGTH)
+            self.tokenizer.enable_padding()
+            # without the arena onnxruntime returns the activation buffers after each batch instead of keeping them
+            session_options = onnxruntime.SessionOptions()
+            session_options.enable_cpu_mem_arena = False
+            self.session = onnxruntime.InferenceSession(str(model_dir / onnx_file), session_options,
+                                                        providers=["CPUExecutionProvider"])
+            self.input_names = [model_input.name for model_input in self.session.get_inputs()]
+            self.backend = "onnx-int8"
+        else:
+            import torch
+            from sentence_transformers import SentenceTransformer
+            print("onnxruntime or tokenizers not installed, quantizing the PyTorch model instead", file=sys.stderr, flush=True)
+            # in place, a quantized copy would keep both the float32 and the int8 weights around while it is made
+            self.model = SentenceTransformer(model_name, device="cpu")
+            torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+            self.backend = "torch-int8"
+
+    def _encode(self, texts):
+        if self.backend == "torch-int8":
+            return self.model.encode(texts, batch_size=len(texts), convert_to_numpy=True).astype(np.float32)
+        encodings = self.tokenizer.encode_batch(texts)
+        inputs = {
+            "input_ids": np.array([encoding.ids for encoding in encodings], dtype=np.int64),
+            "attention_mask": np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64),
+            "token_type_ids": np.array([encoding.type_ids for encoding in encodings], dtype=np.int64)
+        }
+        tokens = self.session.run(None, {name: inputs[name] for name in self.input_names})[0]
+        mask = inputs["attention_mask"][:, :, None].astype(np.float32)
+        vectors = (tokens * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        vectors = [self._encode(texts[start:start + ENCODE_BATCH]) for start in range(0, len(texts), ENCODE_BATCH)]
+        return np.concatenate(vectors).astype(np.float32).tolist() if vectors else []
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+def quantize(vectors, precision):
+    """Unit-normalize and store as int8 with one scale per vector, or as float16 (scale 1)"""
+    vectors = np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1)
+    vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    if precision == "float16":
+        return vectors.astype(np.float16), np.ones(len(vectors), dtype=np.float32)
+    scales = np.abs(vectors).max(axis=1) / 127
+    scales[scales == 0] = 1
+    return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+def dequantize(vectors, scales):
+    return vectors.astype(np.float32) * scales[:, None]
+
+class CompactVectorStore(VectorStore):
+    def __init__(self, persist_directory, embedding_function, precision="float16"):
+        """
+        Vector store keeping unit-normalized vectors as float16 (or int8) and searching by cosine similarity.
+
+        A drop-in for the parts of Chroma the agent uses (add, similarity search, get, delete), at a
+        half (or a quarter) of the memory for the vectors and without a database client per culture.
+        Data is loaded on first use and can be released again with release().
+
+        Args:
+            persist_directory (str): Directory holding vectors.npy, scales.npy and chunks.json
+            embedding_function (Embeddings): Model used to embed documents and queries
+            precision (str): 'float16' or 'int8'
+        """
+        self.path = Path(persist_directory)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._embedding = embedding_function
+        self.precision = precision
+        self._lock = threading.RLock()
+        self._vectors = None
+
+    @property
+    def embeddings(self):
+        return self._embedding
+
+    def _load(self):
+        if self._vectors is not None:
+            return
+        chunks_file = self.path / "chunks.json"
+        if not chunks_file.exists():
+            self._ids, self._documents, self._metadatas = [], [], []
+            self._vectors, self._scales = np.zeros((0, 0), dtype=np.int8), np.zeros(0, dtype=np.float32)
+            return
+
+        with open(chunks_file, encoding="utf-8") as f:
+            chunks = json.load(f)
+        self._ids, self._documents, self._metadatas = chunks["ids"], chunks["documents"], chunks["metadatas"]
+        self._vectors = np.load(self.path / "vectors.npy")
+        self._scales = np.load(self.path / "scales.npy")
+        if chunks["precision"] != self.precision:
+            self._vectors, self._scales = quantize(dequantize(self._vectors, self._scales), self.precision)
+            self._save()
+
+    def _save(self):
+        for name, array in (("vectors.npy", self._vectors), ("scales.npy", self._scales)):
+            tmp = self.path / f"{name}.tmp"
+            with open(tmp, "wb") as f:
+                np.save(f, array)
+            os.replace(tmp, self.path / name)
+        tmp = self.path / "chunks.json.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"precision": self.precision, "ids": self._ids, "documents": self._documents,
+                       "metadatas": self._metadatas}, f, ensure_ascii=False)
+        os.replace(tmp, self.path / "chunks.json")
+
+    def release(self):
+        """Drop the loaded vectors and chunks, they are read back from disk on the next call"""
+        with self._lock:
+            self._vectors = None
+            self._ids = self._documents = self._metadatas = self._scales = None
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        texts = list(texts)
+        if not texts:
+            return []
+        metadatas = list(metadatas) if metadatas is not None else [{} for _ in texts]
+        ids = list(ids) if ids is not None else [uuid.uuid4().hex for _ in texts]
+        vectors, scales = quantize(self._embedding.embed_documents(texts), self.precision)
+        with self._lock:
+            self._load()
+            if len(self._ids):
+                vectors = np.concatenate([self._vectors, vectors])
+                scales = np.concatenate([self._scales, scales])
+            self._vectors, self._scales = vectors, scales
+            self._ids += ids
+            self._documents += texts
+            self._metadatas += metadatas
+            self._save()
+        return ids
+
+    def delete(self, ids=None, **kwargs):
+        with self._lock:
+            self._load()
+            doomed = set(ids or [])
+            keep = [i for i, chunk_id in enumerate(self._ids) if chunk_id not in doomed]
+            if len(keep) == len(self._ids):
+                return
+            self._vectors, self._scales = self._vectors[keep], self._scales[keep]
+            self._ids = [self._ids[i] for i in keep]
+            self._documents = [self._documents[i] for i in keep]
+            self._metadatas = [self._metadatas[i] for i in keep]
+            self._save()
+
+    def get(self, ids=None, include=("documents", "metadatas")):
+        """Chunks by id (all if ids is None), in the same shape as Chroma's get"""
+        with self._lock:
+            self._load()
+            if ids is None:
+                rows = list(range(len(self._ids)))
+            else:
+                wanted = set(ids)
+                rows = [i for i, chunk_id in enumerate(self._ids) if chunk_id in wanted]
+            return {
+                "ids": [self._ids[i] for i in rows],
+                "documents": [self._documents[i] for i in rows] if "documents" in include else None,
+                "metadatas": [self._metadatas[i] for i in rows] if "metadatas" in include else None,
+                "embeddings": dequantize(self._vectors[rows], self._scales[rows]) if "embeddings" in include and rows else None
+            }
+
+    def _search(self, embedding, k):
+        with self._lock:
+            self._load()
+            if not self._ids:
+                return []
+            query = np.asarray(embedding, dtype=np.float32)
+            query /= max(np.linalg.norm(query), 1e-12)
+            scores = np.empty(len(self._ids), dtype=np.float32)
+            for start in range(0, len(self._ids), SEARCH_BLOCK):
+                block = self._vectors[start:start + SEARCH_BLOCK]
+                scores[start:start + len(block)] = (block.astype(np.float32) @ query) * self._scales[start:start + len(block)]
+
+            top = np.argpartition(-scores, k)[:k] if len(scores) > k else np.arange(len(scores))
+            top = top[np.argsort(-scores[top], kind="stable")]
+            return [(Document(page_content=self._documents[i], metadata=self._metadatas[i] or {}, id=self._ids[i]),
+                     float(scores[i])) for i in top]
+
+    def similarity_search_with_score(self, query, k=4, **kwargs):
+        return self._search(self._embedding.embed_query(query), k)
+
+    def similarity_search_by_vector(self, embedding, k=4, **kwargs):
+        return [document for document, _ in self._search(embedding, k)]
+
+    def similarity_search(self, query, k=4, **kwargs):
+        return [document for document, _ in self.similarity_search_with_score(query, k)]
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, ids=None, persist_directory=None, precision="float16", **kwargs):
+        store = cls(persist_directory or tempfile.mkdtemp(), embedding, precision)
+        store.add_texts(texts, metadatas, ids)
+        return store
+
+class LazyStore:
+    def __init__(self, open_store):
+        """
+        Opens a culture's vector store on first use and lets an idle one be released.
+
+        Attribute access is forwarded to the store, so it can stand in wherever the store is used.
+
+        Args:
+            open_store (callable): Returns the opened store
+        """
+        self._open_store = open_store
+        self._store = None
+        self._lock = threading.Lock()
+        self.last_used = 0.0
+
+    @property
+    def is_open(self):
+        return self._store is not None
+
+    @property
+    def store(self):
+        """The open store without marking it as used (None if it is not open), for background work"""
+        return self._store
+
+    def _get(self):
+        with self._lock:
+            if self._store is None:
+                self._store = self._open_store()
+            self.last_used = time.monotonic()
+            return self._store
+
+    def __getattr__(self, name):
+        return getattr(self._get(), name)
+
+    def release(self):
+        with self._lock:
+            store, self._store = self._store, None
+        if store is not None and hasattr(store, "release"):
+            store.release()
+
+    def release_if_idle(self, idle_seconds):
+        """Release the store if it was not used for idle_seconds, returns True if it was released"""
+        if self._store is not None and time.monotonic() - self.last_used > idle_seconds:
+            self.release()
+            return True
+        return False
+
+def _log_chunks(log_file):
+    # chunked like CulturalPenPal._initialize_vector_store
+    from langchain.text_splitter import CharacterTextSplitter
+    from langchain_community.document_loaders import TextLoader
+
+    texts = CharacterTextSplitter(chunk_size=1000, chunk_overlap=200).split_documents(
+        TextLoader(str(log_file), encoding="utf-8").load())
+    unique = {hashlib.sha1(text.page_content.encode("utf-8")).hexdigest(): text for text in texts}
+    return list(unique.values()), list(unique.keys())
+
+def _measure(setup, log_file, queries, k, model=EMBEDDING_MODEL):
+    """Build one culture's store the way the agent does and report memory, speed and the search results"""
+    from conversation_log import iter_log_turns
+
+    report = {"setup": setup, "rss_start_mb": rss_mb()}
+    start = time.perf_counter()
+    if setup == "baseline":
+        from langchain_huggingface import HuggingFaceEmbeddings
+        embeddings = HuggingFaceEmbeddings(model_name=model)
+    else:
+        embeddings = QuantizedEmbeddings(model)
+        report["backend"] = embeddings.backend
+    report["model_load_s"] = time.perf_counter() - start
+    report["rss_model_mb"] = rss_mb()
+
+    texts, ids = _log_chunks(log_file)
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        if setup == "baseline":
+            from langchain_chroma import Chroma
+            store = Chroma.from_documents(documents=texts, embedding=embeddings, ids=ids, persist_directory=tmp)
+        else:
+            store = CompactVectorStore.from_documents(texts, embeddings, ids=ids, persist_directory=tmp,
+                                                      precision=setup.split("-")[-1])
+        report["index_s"] = time.perf_counter() - start
+        report["chunks"] = len(ids)
+        report["rss_indexed_mb"] = rss_mb()
+
+        user_inputs = [turn["user"] for turn in iter_log_turns(log_file)]
+        sample = random.Random(0).sample(user_inputs, min(queries, len(user_inputs)))
+        results, timings = [], []
+        for query in sample:
+            start = time.perf_counter()
+            results.append([document.id for document in store.similarity_search(query, k=k)])
+            timings.append(time.perf_counter() - start)
+        report["query_ms_p50"] = float(np.median(timings) * 1000) if timings else 0.0
+        report["results"] = results
+    report["peak_rss_mb"] = peak_rss_mb()
+    return report
+
+def _measure_agent(setup, log_file, queries):
+    """
+    Run a whole CulturalPenPal the way a learner would, visiting all five cultures, and report the process's RSS
+    after startup, once every culture's store was used, and after the other cultures' stores were released.
+    """
+    low_memory = setup != "agent-baseline"
+    log_file = Path(log_file).resolve()
+    if low_memory:
+        skip_torch()
+    from conversation_log import iter_log_turns
+
+    report = {"setup": setup, "rss_start_mb": rss_mb()}
+    with tempfile.TemporaryDirectory() as workdir:
+        # penpal reads cultures/ and writes debug.log relative to the working directory
+        os.symlink(REPO_DIR / "cultures", Path(workdir) / "cultures")
+        os.chdir(workdir)
+        from penpal import CulturalPenPal
+        from protocol import NullChannel
+
+        with open("cultures/culture_profiles.json") as f:
+            culture_profiles = json.load(f)
+        data_dir = Path("pen_pal_data")
+        data_dir.mkdir()
+        # every persona has the same history, so the cultures differ only in when their store is opened
+        for profile in culture_profiles.values():
+            shutil.copy(log_file, data_dir / f"{profile['name'].lower()}_conversations.txt")
+
+        cultures = list(culture_profiles)
+        start = time.perf_counter()
+        pen_pal = CulturalPenPal(name=culture_profiles[cultures[0]]["name"], culture=cultures[0], channel=NullChannel(),
+                                 persistence_dir=str(data_dir), low_memory=low_memory,
+                                 vector_precision=setup.split("-")[-1] if low_memory else "float16", idle_release_minutes=0)
+        report["startup_s"] = time.perf_counter() - start
+        report["rss_started_mb"] = rss_mb()
+
+        user_inputs = [turn["user"] for turn in iter_log_turns(log_file)]
+        sample = random.Random(0).sample(user_inputs, min(max(queries // len(cultures), 1), len(user_inputs)))
+        timings = []
+        for culture in cultures:
+            pen_pal.switch_personality(culture)
+            for query in sample:
+                start = time.perf_counter()
+                pen_pal.recall_memories(query)
+                timings.append(time.perf_counter() - start)
+        report["recall_ms_p50"] = float(np.median(timings) * 1000) if timings else 0.0
+        report["rss_all_cultures_mb"] = rss_mb()
+
+        pen_pal.release_idle_stores()
+        report["rss_released_mb"] = rss_mb()
+        report["open_stores"] = pen_pal.buffer_sizes()["open_vector_stores"]
+        report["torch_loaded"] = "torch" in sys.modules
+    report["peak_rss_mb"] = peak_rss_mb()
+    return report
+
+def _run_measure(setup, log_file, queries, k, model):
+    output = subprocess.run(
+        [sys.executable, __file__, "--measure", setup, "--log", str(log_file), "--queries", str(queries), "--k", str(k),
+         "--model", model],
+        check=True, capture_output=True, text=True
+    ).stdout
+    # the report is the last line, in case a library printed something before it
+    return json.loads(output.splitlines()[-1])
+
+def memory_report(log_file, queries=200, k=4, setups=("baseline", "low-memory-float16", "low-memory-int8"), model=EMBEDDING_MODEL,
+                  agent_setups=("agent-baseline", "agent-low-memory-float16", "agent-low-memory-int8")):
+    """
+    Run every setup in a fresh process (so peak RSS is not shared) and compare them to the baseline.
+
+    Retrieval quality is the overlap of each setup's top-k chunks with the full-precision
+    top-k for the same queries. The agent setups then measure a whole CulturalPenPal process
+    with all five cultures' stores (always with all-MiniLM-L6-v2, like the agent).
+    """
+    reports = [_run_measure(setup, log_file, queries, k, model) for setup in setups]
+
+    baseline = reports[0]["results"]
+    print(f"{'setup':<20} {'model RSS':>10} {'peak RSS':>9} {'index':>8} {'query p50':>10} {'top-1 =':>8} {f'top-{k} overlap':>14}")
+    for report in reports:
+        top1 = np.mean([bool(a) and bool(b) and a[0] == b[0] for a, b in zip(report["results"], baseline)])
+        overlap = np.mean([len(set(a) & set(b)) / max(len(b), 1) for a, b in zip(report["results"], baseline)])
+        print(f"{report['setup']:<20} {report['rss_model_mb']:>8.0f}MB {report['peak_rss_mb']:>7.0f}MB "
+              f"{report['index_s']:>7.1f}s {report['query_ms_p50']:>8.2f}ms {top1:>8.2%} {overlap:>14.2%}")
+
+    if agent_setups:
+        print(f"\n{'agent':<26} {'startup':>8} {'RSS started':>12} {'5 cultures':>11} {'released':>9} {'peak RSS':>9} "
+              f"{'recall p50':>11} {'PyTorch':>8}")
+    for setup in agent_setups:
+        report = _run_measure(setup, log_file, queries, k, model)
+        reports.append(report)
+        print(f"{report['setup']:<26} {report['startup_s']:>7.1f}s {report['rss_started_mb']:>10.0f}MB "
+              f"{report['rss_all_cultures_mb']:>9.0f}MB {report['rss_released_mb']:>7.0f}MB {report['peak_rss_mb']:>7.0f}MB "
+              f"{report['recall_ms_p50']:>9.2f}ms {'loaded' if report['torch_loaded'] else 'no':>8}", flush=True)
+    return reports
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Peak RSS and retrieval quality of the low-memory mode against the default setup")
+    parser.add_argument("--log", help="conversation log to index (default: a synthetic log)")
+    parser.add_argument("--turns", type=int, default=5000, help="turns in the synthetic log")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--model", default=EMBEDDING_MODEL, help="embedding model name or local path")
+    parser.add_argument("--measure", help=argparse.SUPPRESS) # runs one setup, used by the report's child processes
+    args = parser.parse_args()
+
+    if args.measure and args.measure.startswith("agent-"):
+        print(json.dumps(_measure_agent(args.measure, args.log, args.queries)))
+    elif args.measure:
+        if args.measure != "baseline":
+            skip_torch()
+        print(json.dumps(_measure(args.measure, args.log, args.queries, args.k, args.model)))
+    elif args.log:
+        memory_report(args.log, args.queries, args.k, model=args.model)
+    else:
+        from recall_index import _synthetic_log
+        with tempfile.TemporaryDirectory() as tmp:
+            log_file = Path(tmp) / "synthetic_conversations.txt"
+            _synthetic_log(log_file, args.turns)
+            memory_report(log_file, args.queries, args.k, model=args.model)
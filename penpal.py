@@ -9,30 +9,68 @@ import time
 import codecs
 import sys
 import random
+import hashlib
+import argparse
 import pygame
 import speech_recognition as sr
 
 from gtts import gTTS
 from pathlib import Path
 from datetime import datetime
-from langchain_chroma import Chroma
-from langchain_ollama import OllamaLLM
-from langchain_huggingface import HuggingFaceEmbeddings
+from low_memory import CompactVectorStore, LazyStore, QuantizedEmbeddings, VECTOR_PRECISIONS, skip_torch
+
+# has to happen before langchain imports transformers (see skip_torch)
+if "--low-memory" in sys.argv:
+    skip_torch()
+
 from langchain.text_splitter import CharacterTextSplitter
 from langchain_core.output_parsers import StrOutputParser
 from langchain_community.document_loaders import TextLoader
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.messages import SystemMessage
 from langchain.memory import ConversationBufferMemory, ConversationSummaryBufferMemory
+from llm_gateway import GatewayError, get_gateway
+from protocol import open_stdio_channel
+from recall_index import HybridRecallIndex
+from conversation_log import TIME_PATTERN, format_turn
+from vectordb_maintenance import load_tombstones, start_background_maintenance
+from vocabulary import VocabularyTracker
+from session import SessionSnapshot
+from profiling import MemoryProfiler, SamplingProfiler
+from endpointing import AdaptiveEndpointer
 
 sys.stderr = open("debug.log", "w")
 
 environ['PYGAME_HIDE_SUPPORT_PROMPT'] = '1'
 MAX_TOKENS = 200
+LIGHT_MAX_TOKENS = 80 # short acknowledgements and vocabulary drills need far fewer tokens
+RECALLED_TURNS = 3 # earlier turns recalled from the conversation history on every turn
+MAX_CONCURRENT_GENERATIONS = 2 # generations sent to Ollama at once, the rest wait in the gateway queue
+ROUTING_POLICIES = ["heuristic", "off"]
+
+# Turns that can be answered by the small model
+LIGHT_TURN_PATTERNS = [
+    r"^(yes|yeah|yep|no|nope|ok|okay|sure|thanks|thank you|cool|nice|great|got it|i see)\b",
+    r"^(hi|hello|hey|good (morning|afternoon|evening)|bye|goodbye)\b",
+    r"how (do|would) (you|i) say\b",
+    r"what does .+ mean",
+    r"(translate|spell|repeat|again)\b",
+    r"^(use text|use speech)$"
+]
+
+# Turns that need the main model even when they are short
+FULL_TURN_PATTERNS = [
+    r"\b(why|explain|tell me (about|more)|describe|difference|compare|history|tradition|culture|opinion)\b",
+    r"\b(learn|study|practice|speak|teach|switch|change)\b"
+]
 
 class CulturalPenPal:
     def __init__(self, name="Aria", culture="American", 
                  model_name="llama2", use_memory=True, # Change flag here
-                 persistence_dir="pen_pal_data"):
+                 persistence_dir="pen_pal_data", light_model_name="phi",
+                 routing="heuristic", max_tokens=MAX_TOKENS, light_max_tokens=LIGHT_MAX_TOKENS,
+                 channel=None, maintain_every=0, retention_days=None, max_chunks=None, resume=False,
+                 low_memory=False, vector_precision="float16", idle_release_minutes=10, profile_memory=False):
         """
         Initialize the Cultural Pen Pal agent with free language models.
         
@@ -41,9 +79,25 @@ class CulturalPenPal:
             culture (str): The cultural background of the pen pal
             model_name (str): The local model to use with Ollama (e.g., 'llama2', 'mistral', 'phi')
             persistence_dir (str): Directory to store persistent memory
+            light_model_name (str): Smaller local model used for short, low-complexity turns
+            routing (str): Routing policy, 'heuristic' sends light turns to the small model, 'off' always uses model_name
+            max_tokens (int): Maximum tokens generated by the main model
+            light_max_tokens (int): Maximum tokens generated by the small model
+            channel (MessageChannel): Framed message channel to the GUI (defaults to stdin/stdout)
+            maintain_every (float): Minutes between background retention passes over the vector stores (0 disables)
+            retention_days (float): Vector store chunks older than this are expired (None keeps everything)
+            max_chunks (int): Maximum number of chunks kept per vector store (None for no limit)
+            resume (bool): Continue the last session (persona, short-term memory, speech settings) from its snapshot
+            low_memory (bool): Use an int8 embedding model, compact vector stores and open them only when needed
+            vector_precision (str): How the low-memory stores keep vectors, 'float16' or 'int8'
+            idle_release_minutes (float): Low-memory mode releases other cultures' stores unused for this long
+            profile_memory (bool): Take a tracemalloc snapshot after every turn (toggle later with '/profile')
         """
         random.seed(42)
         
+        self.channel = channel if channel is not None else open_stdio_channel()
+        self.turn = 0
+        
         self.name = name
         self.default_culture = culture
         self.current_culture = culture
@@ -52,12 +106,34 @@ class CulturalPenPal:
         
         self.speech_recognition_language = "en-US"
         self.use_speech = False
-        
-        self.llm = OllamaLLM(model=model_name, num_predict=MAX_TOKENS)
-        
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name="all-MiniLM-L6-v2"
-        )
+        # learns how long this learner pauses mid-turn, so spoken turns end soon after they finish
+        self.endpointer = AdaptiveEndpointer()
+        
+        # All agents in this process share one gateway (pooled connections, capped concurrency)
+        self.gateway = get_gateway(max_concurrency=MAX_CONCURRENT_GENERATIONS)
+        self.routing = routing
+        self.model_tiers = {"full": {"model": model_name, "max_tokens": max_tokens}}
+        if routing != "off":
+            self.model_tiers["light"] = {"model": light_model_name, "max_tokens": light_max_tokens}
+
+        self.llms = {}
+        for tier, config in self.model_tiers.items():
+            # a light model that is not available (e.g. not pulled) would only add a failed request to every light turn
+            self.gateway.warm_up(config["model"], on_failure=self.disable_light_tier if tier == "light" else None)
+            self.llms[tier] = self.gateway.as_runnable(config["model"], num_predict=config["max_tokens"])
+        self.llm = self.llms["full"]
+        
+        self.low_memory = low_memory
+        self.vector_precision = vector_precision
+        self.idle_release_seconds = idle_release_minutes * 60
+        if low_memory:
+            self.embeddings = QuantizedEmbeddings("all-MiniLM-L6-v2")
+        else:
+            # imported here so the low-memory mode does not load sentence-transformers and PyTorch
+            from langchain_huggingface import HuggingFaceEmbeddings
+            self.embeddings = HuggingFaceEmbeddings(
+                model_name="all-MiniLM-L6-v2"
+            )
         
         self.persistence_dir = Path(persistence_dir)
         self.persistence_dir.mkdir(exist_ok=True)
@@ -80,6 +156,8 @@ class CulturalPenPal:
             memory_key="short_term_memory", 
             return_messages=True
         )
+        # turns logged from this time on are in the short-term memory, so they are not recalled again
+        self.short_term_since = datetime.now().isoformat()
         
         self.long_term_memory = ConversationBufferMemory(
             memory_key="long_term_memory",
@@ -93,13 +171,58 @@ class CulturalPenPal:
             self.knowledge[profile] = self._load_knowledge(profile)
         
         for profile in self.culture_profiles:
-            self.vector_stores[profile] = self._initialize_vector_store(profile)
+            if low_memory:
+                # opened (and the log indexed) on first use, see release_idle_stores
+                self.vector_stores[profile] = LazyStore(lambda profile=profile: self._initialize_vector_store(profile))
+            else:
+                self.vector_stores[profile] = self._initialize_vector_store(profile)
+        
+        # Lexical + vector index over past turns, used to recall what the user told each persona.
+        # Built on a culture's first turn from the index saved at the end of the last session (see recall_index)
+        self.recall_indexes = {}
+        
+        if maintain_every > 0:
+            self.maintenance = start_background_maintenance(
+                self.vector_stores, maintain_every, max_age_days=retention_days, max_chunks=max_chunks,
+                store_paths={profile: self._vector_store_path(profile) for profile in self.culture_profiles}
+            )
+        
+        # Which words_to_learn the learner has seen and used, picks the words for the prompt
+        self.vocabulary = {}
+        for profile in self.culture_profiles:
+            culture_name = self.culture_profiles[profile]["name"]
+            word_count = len(self.culture_profiles[profile]["words_to_learn"])
+            # the memory condition teaches the first ten words, the no-memory condition the rest
+            pool = range(10) if self.use_memory else range(10, word_count)
+            state_file = self.persistence_dir / f"{culture_name.lower()}_vocabulary.json" if self.use_memory else None
+            self.vocabulary[profile] = VocabularyTracker(self.culture_profiles, profile, pool, state_file)
         
+        self.chain_key = None
         self.setup_conversation_chain()
         
-        # Initialize pygame for audio playback
-        pygame.init()
-        print(f"{self.name} is ready to converse! Say or type 'exit' to end the conversation.", flush=True)
+        # Snapshot of the live session, appended after every turn
+        self.session = SessionSnapshot(self.persistence_dir / "session.jsonl")
+        if resume:
+            start = time.perf_counter()
+            state = self.session.load()
+            if state is not None:
+                self.restore_session(state)
+                print(f"Resumed session with {len(state['exchanges'])} exchanges in "
+                      f"{(time.perf_counter() - start) * 1000:.1f}ms", file=sys.stderr, flush=True)
+        self.session.start(self.session_state())
+        
+        # Opt-in profiling, written to pen_pal_data/profiles
+        self.memory_profiler = MemoryProfiler(self.persistence_dir / "profiles")
+        self.cpu_profiler = SamplingProfiler(self.persistence_dir / "profiles")
+        if profile_memory:
+            self.memory_profiler.start()
+        
+        # Initialize pygame for audio playback (only the mixer is used)
+        if low_memory:
+            pygame.mixer.init()
+        else:
+            pygame.init()
+        self.channel.status(f"{self.name} is ready to converse! Say or type 'exit' to end the conversation.")
         
     def _load_knowledge(self, culture):
         """Load the pen pal's knowledge from file or initialize if not exists"""
@@ -148,11 +271,15 @@ class CulturalPenPal:
         with codecs.open(memory_file, 'w', encoding='utf-8') as f:
             json.dump(knowledge, f, indent=2, ensure_ascii=False)
     
+    def _vector_store_path(self, culture):
+        vector_db_path = self.persistence_dir / f"{self.culture_profiles[culture]['name'].lower()}_vectordb"
+        return vector_db_path.with_name(vector_db_path.name + "_compact") if self.low_memory else vector_db_path
+    
     def _initialize_vector_store(self, culture):
         """Initialize or load the vector store for semantic search"""
-        profile = self.culture_profiles[culture]
-        culture_name = profile["name"]
-        vector_db_path = self.persistence_dir / f"{culture_name.lower()}_vectordb"
+        if not self.low_memory:
+            from langchain_chroma import Chroma # the low-memory mode never opens a Chroma client
+        vector_db_path = self._vector_store_path(culture)
         conversation_log_file = self.conversation_log_files[culture]
         
         if conversation_log_file.exists():
@@ -161,15 +288,38 @@ class CulturalPenPal:
             text_splitter = CharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
             texts = text_splitter.split_documents(documents)
             
-            if vector_db_path.exists():
+            # Content-addressed ids so chunks already in the store are not embedded and added again on every start,
+            # the timestamp lets the retention policy expire old chunks
+            unique_texts = {hashlib.sha1(text.page_content.encode("utf-8")).hexdigest(): text for text in texts}
+            # chunks the retention policy deleted stay deleted
+            for text_id in load_tombstones(vector_db_path):
+                unique_texts.pop(text_id, None)
+            ids, texts = list(unique_texts.keys()), list(unique_texts.values())
+            for text in texts:
+                match = TIME_PATTERN.search(text.page_content)
+                if match:
+                    text.metadata["timestamp"] = match.group(1)
+            
+            if self.low_memory:
+                vector_store = CompactVectorStore(vector_db_path, self.embeddings, self.vector_precision)
+                if texts:
+                    existing = set(vector_store.get(ids=ids, include=[])["ids"])
+                    new = [(text, text_id) for text, text_id in zip(texts, ids) if text_id not in existing]
+                    if new:
+                        vector_store.add_documents([text for text, _ in new], ids=[text_id for _, text_id in new])
+            elif vector_db_path.exists():
                 vector_store = Chroma(persist_directory=str(vector_db_path), embedding_function=self.embeddings)
                 if texts:
-                    vector_store.add_documents(texts)
+                    existing = set(vector_store.get(ids=ids, include=[])["ids"])
+                    new = [(text, text_id) for text, text_id in zip(texts, ids) if text_id not in existing]
+                    if new:
+                        vector_store.add_documents([text for text, _ in new], ids=[text_id for _, text_id in new])
             else:
                 if texts:
                     vector_store = Chroma.from_documents(
                         documents=texts, 
                         embedding=self.embeddings,
+                        ids=ids,
                         persist_directory=str(vector_db_path)
                     )
                 else:
@@ -177,6 +327,8 @@ class CulturalPenPal:
                         persist_directory=str(vector_db_path),
                         embedding_function=self.embeddings
                     )
+        elif self.low_memory:
+            vector_store = CompactVectorStore(vector_db_path, self.embeddings, self.vector_precision)
         else:
             vector_store = Chroma(
                 persist_directory=str(vector_db_path),
@@ -185,11 +337,34 @@ class CulturalPenPal:
             
         return vector_store
     
+    def _recall_index_file(self, culture):
+        return self.persistence_dir / f"{self.culture_profiles[culture]['name'].lower()}_recall_index.pkl"
+    
+    def recall_index(self, culture):
+        """The culture's recall index, loaded (or built from its conversation log) on first use"""
+        index = self.recall_indexes.get(culture)
+        if index is None:
+            start = time.perf_counter()
+            index = self.recall_indexes[culture] = HybridRecallIndex.load(
+                self.conversation_log_files[culture], self._recall_index_file(culture), self.vector_stores[culture]
+            )
+            print(f"Loaded recall index for {culture} ({len(index)} turns) in "
+                  f"{(time.perf_counter() - start) * 1000:.1f}ms", file=sys.stderr, flush=True)
+        return index
+    
+    def save_recall_index(self, culture):
+        index = self.recall_indexes.get(culture)
+        if index is not None:
+            index.save(self.conversation_log_files[culture], self._recall_index_file(culture))
+    
     def switch_personality(self, new_culture):
         """Switch to a different cultural personality"""
         if new_culture in self.culture_profiles:
             # Save current state
             self._save_knowledge()
+            self.vocabulary[self.current_culture].save()
+            self.save_recall_index(self.current_culture)
+            old_culture = self.current_culture
             
             # Set up new conversation chain
             self.current_culture = new_culture
@@ -202,6 +377,7 @@ class CulturalPenPal:
                 memory_key="short_term_memory", 
                 return_messages=True
             )
+            self.short_term_since = datetime.now().isoformat()
             
             self.long_term_memory = ConversationBufferMemory(
                 memory_key="long_term_memory",
@@ -210,20 +386,91 @@ class CulturalPenPal:
 
             self.load_long_term_memory(new_culture)
             
+            self.session.append({
+                "type": "state",
+                "name": self.name,
+                "culture": self.current_culture,
+                "short_term_since": self.short_term_since,
+                "vocabulary": {culture: self.vocabulary[culture].state() for culture in (old_culture, new_culture)}
+            }, full_state=self.session_state)
+            
             return f"Hello! I'm {self.name}, your {new_culture} cultural pen pal. I'll be speaking in {profile['language']} from now on. How can I help you today?"
         else:
             return f"I'm sorry, I don't have information about {new_culture} culture. I'll continue as {self.name} from {self.current_culture} culture."
     
+    def release_idle_stores(self):
+        """Low-memory mode: close the vector stores (and drop the recall indexes) of other cultures that were not used for a while"""
+        for culture, store in self.vector_stores.items():
+            if culture != self.current_culture and isinstance(store, LazyStore) and store.release_if_idle(self.idle_release_seconds):
+                print(f"Released idle vector store for {culture}", file=sys.stderr, flush=True)
+                if culture in self.recall_indexes:
+                    self.save_recall_index(culture)
+                    del self.recall_indexes[culture]
+    
+    def buffer_sizes(self):
+        """Sizes of the buffers that grow over a session, reported by the memory profiler"""
+        sizes = {}
+        for key, memory in (("short_term_memory", self.short_term_memory), ("long_term_memory", self.long_term_memory)):
+            messages = memory.chat_memory.messages
+            sizes[key] = {"messages": len(messages), "chars": sum(len(message.content) for message in messages)}
+        sizes["recall_index_turns"] = sum(len(index) for index in self.recall_indexes.values())
+        sizes["open_vector_stores"] = sum(getattr(store, "is_open", True) for store in self.vector_stores.values())
+        return sizes
+    
+    def toggle_profiling(self, cpu=False):
+        """Switch the per-turn memory profiler (or the sampling CPU profiler of this thread) on or off"""
+        profiler = self.cpu_profiler if cpu else self.memory_profiler
+        kind = "CPU" if cpu else "Memory"
+        if profiler.enabled:
+            return f"{kind} profiling stopped, written to {profiler.stop()}"
+        profiler.start()
+        return f"{kind} profiling started"
+    
+    def session_state(self):
+        """Everything needed to resume the session, see session.py"""
+        messages = self.short_term_memory.chat_memory.messages
+        return {
+            "name": self.name,
+            "culture": self.current_culture,
+            "speech_recognition_language": self.speech_recognition_language,
+            "use_speech": self.use_speech,
+            "turn": self.turn,
+            "short_term_since": self.short_term_since,
+            "exchanges": [[messages[i].content, messages[i + 1].content] for i in range(0, len(messages) - 1, 2)],
+            "vocabulary": {culture: tracker.state() for culture, tracker in self.vocabulary.items()}
+        }
+    
+    def restore_session(self, state):
+        """Restore a session snapshot without replaying the conversation log"""
+        for culture, vocabulary_state in state["vocabulary"].items():
+            if culture in self.vocabulary:
+                self.vocabulary[culture].load_state(vocabulary_state)
+        
+        if state["culture"] in self.culture_profiles and state["culture"] != self.current_culture:
+            self.switch_personality(state["culture"])
+        self.name = state["name"]
+        self.speech_recognition_language = state["speech_recognition_language"]
+        self.use_speech = state["use_speech"]
+        self.turn = state["turn"]
+        # the restored exchanges are back in the short-term memory
+        self.short_term_since = state.get("short_term_since", self.short_term_since)
+        
+        for user_input, response in state["exchanges"]:
+            self.short_term_memory.save_context({"input": user_input}, {"output": response})
+        self.setup_conversation_chain()
+    
     def get_learnable_words(self):
-        profile = self.culture_profiles[self.current_culture]
-        
-        if self.use_memory:
-            return '\n'.join([pair['word'] + ':' + pair['meaning'] for pair in profile['words_to_learn'][:10]])
-        else:
-            return '\n'.join([pair['word'] + ':' + pair['meaning'] for pair in profile['words_to_learn'][10:]])            
+        # the words due for review in the spaced-repetition schedule (from the first or the other ten words)
+        return '\n'.join([pair['word'] + ':' + pair['meaning'] for pair in self.vocabulary[self.current_culture].selected_words()])
     
     def setup_conversation_chain(self):
         """Set up the LangChain conversation chain with the system prompt"""
+        # Only rebuild when something in the system prompt changed
+        chain_key = (self.name, self.current_culture, self.current_language, self.vocabulary[self.current_culture].selected)
+        if chain_key == self.chain_key:
+            return
+        self.chain_key = chain_key
+        
         profile = self.culture_profiles[self.current_culture]
                 
         system_template = f"""
@@ -259,10 +506,76 @@ class CulturalPenPal:
             ("system", system_template),
             MessagesPlaceholder(variable_name="short_term_memory"),
             MessagesPlaceholder(variable_name="long_term_memory"),
+            MessagesPlaceholder(variable_name="recalled_memories"),
             ("human", "{input}")
         ])
         
-        self.chain = self.prompt | self.llm | StrOutputParser()
+        self.chains = {tier: self.prompt | llm | StrOutputParser() for tier, llm in self.llms.items()}
+        self.chain = self.chains["full"]
+    
+    def disable_light_tier(self, error):
+        """
+        Send every turn to the main model from now on if the small model cannot serve at all.
+
+        Only client errors (e.g. 404 when the model is not pulled) disable the tier. Ollama not
+        running yet, 5xx responses and queue timeouts are transient and left to the per-turn fallback.
+        """
+        if error.status is None or not 400 <= error.status < 500:
+            return
+        if self.routing != "off":
+            print(f"Disabling the light model tier ({error})", file=sys.stderr, flush=True)
+            self.routing = "off"
+    
+    def classify_turn(self, user_input):
+        """Cheaply decide whether a turn is 'light' (short or drill-like) or needs the 'full' model"""
+        if self.routing == "off":
+            return "full"
+        
+        user_input_lower = user_input.lower().strip()
+        
+        for pattern in FULL_TURN_PATTERNS:
+            if re.search(pattern, user_input_lower):
+                return "full"
+        
+        for pattern in LIGHT_TURN_PATTERNS:
+            if re.search(pattern, user_input_lower):
+                return "light"
+        
+        # Very short turns without any open-ended cue are cheap to answer
+        if len(user_input_lower.split()) <= 3 and "?" not in user_input_lower:
+            return "light"
+        
+        return "full"
+    
+    def _stream_chain(self, chain, inputs, on_delta, pieces):
+        for piece in chain.stream(inputs):
+            pieces.append(piece)
+            if on_delta is not None:
+                on_delta(piece)
+        return "".join(pieces)
+    
+    def generate_response(self, user_input, on_delta=None):
+        """Route the turn to a model tier and generate the raw response, streaming pieces to on_delta"""
+        inputs = {
+            "input": user_input,
+            "short_term_memory": self.short_term_memory.buffer,
+            "long_term_memory": self.long_term_memory.buffer,
+            "recalled_memories": self.recall_memories(user_input)
+        }
+        tier = self.classify_turn(user_input)
+        print(f"Routing turn to {tier} model ({self.model_tiers[tier]['model']})", file=sys.stderr, flush=True)
+        
+        pieces = []
+        try:
+            return self._stream_chain(self.chains[tier], inputs, on_delta, pieces), tier
+        except GatewayError as e:
+            # Only fall back if nothing has been streamed to the GUI yet
+            if tier == "full" or pieces:
+                raise
+            # e.g. the small model has not been pulled, fall back to the main model (for every later turn too if it is missing)
+            print(f"Light model failed ({e}), falling back to the full model", file=sys.stderr, flush=True)
+            self.disable_light_tier(e)
+            return self._stream_chain(self.chains["full"], inputs, on_delta, []), "full"
     
     def clean_response(self, response):
         """Clean the response from unwanted prefixes and problematic characters"""
@@ -297,10 +610,24 @@ class CulturalPenPal:
         # Log conversation
         timestamp = datetime.now().isoformat()
         conversation_log_file = self.conversation_log_files[self.current_culture]
+        # loaded before the turn is logged, so the turn is not indexed twice
+        recall_index = self.recall_index(self.current_culture)
         with codecs.open(conversation_log_file, "a", encoding='utf-8') as f:
-            f.write(f"TIME: {timestamp}\n")
-            f.write(f"USER: {user_input}\n")
-            f.write(f"{self.name.upper()}: {response}\n\n")
+            f.write(format_turn(timestamp, user_input, self.name, response))
+        
+        recall_index.add_turn(timestamp, user_input, response)
+    
+    def recall_memories(self, user_input):
+        """Look up earlier turns relevant to the user's message (e.g. names, places, words they struggled with)"""
+        if not self.use_memory: return []
+        
+        # turns already in the short-term memory would be sent to the model twice
+        hits = self.recall_index(self.current_culture).search(user_input, k=RECALLED_TURNS, before=self.short_term_since)
+        if not hits:
+            return []
+        
+        recalled = "\n".join(f"- On {hit['time'][:10]} the user said: {hit['user']} (you replied: {hit['response']})" for hit in hits)
+        return [SystemMessage(content=f"Things you remember from earlier conversations with the user:\n{recalled}")]
     
     def toggle_speech_recognition_language(self):
         """Toggle between English and the current culture's language for speech recognition"""
@@ -317,25 +644,29 @@ class CulturalPenPal:
         """Capture speech input from the user"""
         recognizer = sr.Recognizer()
             
-        recognizer.pause_threshold = 2.0  # Increase the silence tolerance (default is 0.8 seconds)
+        # The endpointer measures the background noise itself and ends the turn once the learner's
+        # usual pause (per recognition language) has passed, instead of a fixed 2 seconds of silence
         with sr.Microphone() as source:
-            print("Listening for your input...")
-            recognizer.adjust_for_ambient_noise(source, duration=1)
-            audio = recognizer.listen(source, timeout=20)
+            self.channel.status("Listening for your input...")
+            audio = self.endpointer.listen(source, self.speech_recognition_language, timeout=20)
+        
+        if audio is None:
+            self.channel.status("Sorry, I did not hear anything.")
+            return "I couldn't hear you clearly. Could you please repeat that?"
         
         try:
             # Always use English for speech recognition unless explicitly toggled
             user_input = recognizer.recognize_google(audio, language=self.speech_recognition_language)
-            print(f"You said: {user_input}", flush=True)
+            self.channel.status(f"You said: {user_input}")
             return user_input
         except sr.UnknownValueError:
-            print("Sorry, I could not understand the audio.")
+            self.channel.status("Sorry, I could not understand the audio.")
             return "I couldn't hear you clearly. Could you please repeat that?"
         except sr.RequestError:
-            print("There was an issue with the speech recognition service.")
+            self.channel.status("There was an issue with the speech recognition service.")
             return "I'm having trouble with my hearing. Let's try again."
         except Exception as e:
-            print(f"Error in speech recognition: {str(e)}")
+            self.channel.error(f"Error in speech recognition: {str(e)}")
             return "There was a problem with the speech recognition. Let's try again."
     
     def speak_output(self, text):
@@ -372,9 +703,9 @@ class CulturalPenPal:
                         pass
                 
         except Exception as e:
-            print(f"Error in text-to-speech: {str(e)}")
-            print("Unable to speak the response. Here it is in text:")
-            print(text)
+            self.channel.error(f"Error in text-to-speech: {str(e)}")
+            self.channel.status("Unable to speak the response. Here it is in text:")
+            self.channel.status(text)
     
     def detect_language_request(self, user_input):
         """Detect if the user is asking to learn a specific language"""
@@ -420,33 +751,96 @@ class CulturalPenPal:
         
         return None
 
+    def respond(self, user_input):
+        """Generate, clean and remember the reply to one turn, streaming deltas to the GUI"""
+        self.turn += 1
+        turn = self.turn
+        start = time.perf_counter()
+        first_piece = []
+        
+        def on_delta(piece):
+            if not first_piece:
+                first_piece.append(time.perf_counter())
+            self.channel.delta(self.name, piece, turn)
+        
+        raw_response, tier = self.generate_response(user_input, on_delta=on_delta)
+        clean_response = self.clean_response(raw_response)
+        
+        if self.vocabulary[self.current_culture].observe(user_input, clean_response):
+            self.setup_conversation_chain()
+        
+        if self.use_memory:
+            self.add_to_short_term_memory(user_input, clean_response)
+        
+        self.channel.reply(self.name, clean_response, turn)
+        self.session.append({
+            "type": "turn",
+            "user": user_input,
+            "response": clean_response,
+            "remembered": self.use_memory,
+            "turn": turn,
+            "name": self.name,
+            "culture": self.current_culture,
+            "speech_recognition_language": self.speech_recognition_language,
+            "use_speech": self.use_speech,
+            "vocabulary": {self.current_culture: self.vocabulary[self.current_culture].state()}
+        }, full_state=self.session_state)
+        if self.low_memory:
+            self.release_idle_stores()
+        end = time.perf_counter()
+        self.channel.metrics(
+            turn=turn,
+            tier=tier,
+            first_token_ms=round((first_piece[0] - start) * 1000, 1) if first_piece else None,
+            total_ms=round((end - start) * 1000, 1),
+            response_chars=len(clean_response),
+            gateway=self.gateway.stats()
+        )
+        if self.memory_profiler.enabled:
+            self.memory_profiler.record_turn(turn, self.buffer_sizes())
+        return clean_response
+
     def converse(self):
         """Modified function to handle conversation from Java commands."""
         greeting = f"Hello! I'm {self.name}, your {self.current_culture} cultural pen pal."
-        print(f"{self.name}: {greeting}", flush=True)
+        self.channel.reply(self.name, greeting, self.turn)
         self.speak_output(greeting)
 
-        while True:
+        while not self.channel.closed:
             try:
-                # Read input from Java (stdin)
-                java_input = sys.stdin.readline().strip()
+                # Read the next framed message from Java (stdin)
+                message = self.channel.read()
+                
+                if message is None:
+                    print("GUI closed the connection, ending conversation", file=sys.stderr, flush=True)
+                    break
                 
-                if not java_input:
+                if message.get("type") == "command":
+                    command = message.get("name", "")
+                else:
+                    command = message.get("text", "").strip()
+                
+                if not command:
                     continue  # Ignore empty input
                 
-                if java_input.lower() == "exit":
+                # '/profile' toggles the memory profiler, '/profile cpu' the CPU profiler
+                if command.lower() in ("/profile", "/profile cpu"):
+                    self.channel.status(self.toggle_profiling(cpu=command.lower() == "/profile cpu"))
+                    continue
+                
+                if command.lower() == "exit":
                     farewell = f"It was nice talking with you! Goodbye!"
-                    print(f"{self.name}: {farewell}", flush=True)
+                    self.channel.reply(self.name, farewell, self.turn)
                     self.speak_output(farewell)
 
-                    print("Exiting conversation...", flush=True)
+                    self.channel.status("Exiting conversation...")
                     break  # Stop the loop
                 
-                elif java_input == "START_AUDIO":
+                elif command.lower() == "start_audio":
                     user_input = self.listen_for_input()  # Capture speech input
                 else:
-                    user_input = java_input  # If Java sends text, use it directly
-                    print(f"You said: {user_input}", flush=True)
+                    user_input = command  # If Java sends text, use it directly
+                    self.channel.status(f"You said: {user_input}")
 
                 
                 if user_input.lower() == "use text":
@@ -454,20 +848,8 @@ class CulturalPenPal:
                 elif user_input.lower() == "use speech":
                     self.use_speech = True
 
-                # Generate response
-                raw_response = self.chain.invoke({
-                    "input": user_input,
-                    "short_term_memory": self.short_term_memory.buffer,
-                    "long_term_memory": self.long_term_memory.buffer
-                })
-                
-                clean_response = self.clean_response(raw_response)
-                
-                if self.use_memory:
-                    self.add_to_short_term_memory(user_input, clean_response)
-
-                # Output response
-                print(f"{self.name}: {clean_response}", flush=True)  # Flush ensures the Java GUI receives it
+                # Generate and output the response (written by the channel's writer thread)
+                clean_response = self.respond(user_input)
                 self.speak_output(clean_response)
 
             except KeyboardInterrupt:
@@ -476,31 +858,80 @@ class CulturalPenPal:
             except Exception as e:
                 print(f"Error: {str(e)}", file=sys.stderr, flush=True)
                 err_msg = "I'm having some technical difficulties. Let's try again."
-                print(f"{self.name}: {err_msg}", flush=True)
+                self.channel.reply(self.name, err_msg, self.turn)
                 self.speak_output(err_msg)
 
 if __name__ == "__main__":
-    # grab sys args from the GUI
-    if len(sys.argv) > 1:
-        selected_language = sys.argv[1] 
-        user_name = sys.argv[2] if len(sys.argv) > 2 else "Default Name"
+    # grab sys args from the GUI (language and name), model options are flags
+    parser = argparse.ArgumentParser(description="Cultural PenPal conversational agent")
+    parser.add_argument("language", nargs="?", default=None, help="culture to start with (default: American)")
+    parser.add_argument("name", nargs="?", default=None, help="name of the pen pal")
+    parser.add_argument("--model", default="llama2", help="main model for open-ended conversation")
+    parser.add_argument("--light-model", default="phi", help="small model for short, low-complexity turns")
+    parser.add_argument("--routing", choices=ROUTING_POLICIES, default="heuristic",
+                        help="'heuristic' routes light turns to the small model, 'off' always uses the main model")
+    parser.add_argument("--max-tokens", type=int, default=MAX_TOKENS, help="token limit for the main model")
+    parser.add_argument("--light-max-tokens", type=int, default=LIGHT_MAX_TOKENS, help="token limit for the small model")
+    parser.add_argument("--maintain-every", type=float, default=0,
+                        help="minutes between background expiry/dedupe passes over the vector stores (0 disables)")
+    parser.add_argument("--retention-days", type=float, default=None, help="expire vector store chunks older than this")
+    parser.add_argument("--max-chunks", type=int, default=None, help="keep at most this many chunks per vector store")
+    parser.add_argument("--low-memory", action="store_true",
+                        help="int8 embedding model, compact vector stores opened on demand and released when idle")
+    parser.add_argument("--vector-precision", choices=VECTOR_PRECISIONS, default="float16",
+                        help="how the low-memory vector stores keep vectors")
+    parser.add_argument("--idle-release-minutes", type=float, default=10,
+                        help="low-memory mode releases other cultures' vector stores unused for this long")
+    parser.add_argument("--profile", action="store_true",
+                        help="log tracemalloc diffs and buffer sizes after every turn (toggle live with '/profile')")
+    parser.add_argument("--profile-cpu", action="store_true",
+                        help="sample the conversation loop's stack and write a CPU profile on exit (toggle live with '/profile cpu')")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue the last session (persona, short-term memory, speech settings) instead of starting fresh")
+    args = parser.parse_args()
+
+    if args.language is not None:
+        selected_language = args.language
+        user_name = args.name if args.name is not None else "Default Name"
     else:
         # default values
         selected_language = "American"
         user_name = "Aria"
 
-    print("Starting Cultural PenPal...", flush=True)
+    print("Starting Cultural PenPal...", file=sys.stderr, flush=True)
     # Create a cultural pen pal instance (DEFAULT = USE MEMORY)
     pen_pal = CulturalPenPal(
         name=user_name,
          #UNCOMMENT BELOW TO DISABLE MEMORY
         #     use_memory=False,
         culture=selected_language,
-        model_name="llama2" # TODO maybe introduce a CLI flag for easy model switching
+        model_name=args.model,
+        light_model_name=args.light_model,
+        routing=args.routing,
+        max_tokens=args.max_tokens,
+        light_max_tokens=args.light_max_tokens,
+        maintain_every=args.maintain_every,
+        retention_days=args.retention_days,
+        max_chunks=args.max_chunks,
+        resume=args.resume,
+        low_memory=args.low_memory,
+        vector_precision=args.vector_precision,
+        idle_release_minutes=args.idle_release_minutes,
+        profile_memory=args.profile
     )  
 
     # Start the conversation
-    pen_pal.converse()
+    if args.profile_cpu:
+        pen_pal.cpu_profiler.start()
+    try:
+        pen_pal.converse()
+    finally:
+        pen_pal.cpu_profiler.stop()
+        pen_pal.memory_profiler.stop()
+        pen_pal.vocabulary[pen_pal.current_culture].save()
+        for culture in list(pen_pal.recall_indexes):
+            pen_pal.save_recall_index(culture)
+        pen_pal.session.close()
 
-    print("Cultural PenPal has ended.", flush=True)
-    sys.stdout.flush() 
\ No newline at end of file
+    pen_pal.channel.status("Cultural PenPal has ended.")
+    pen_pal.channel.close()
\ No newline at end of file
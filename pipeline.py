@@ -0,0 +1,145 @@
+import os
+import json
+import time
+import hashlib
+import traceback
+
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+# One small JSON stamp per task records the input hashes of its last successful run
+STAMP_DIR = os.path.join(".cache", "pipeline")
+
+class Task:
+    def __init__(self, name, func, inputs, outputs, args=()):
+        """
+        One step of the analysis that turns input files into output files.
+
+        Args:
+            name (str): Unique task name
+            func (callable): Module-level function to run (it must be picklable)
+            inputs (list): Files the task reads, including the code it depends on
+            outputs (list): Files the task writes
+            args (tuple): Positional arguments for func
+        """
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.args = tuple(args)
+
+def file_hash(path):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _fingerprint(task):
+    return {path: file_hash(path) for path in task.inputs}
+
+def _stamp_path(task):
+    return os.path.join(STAMP_DIR, f"{task.name}.json")
+
+def is_up_to_date(task, fingerprint):
+    """True if the outputs exist and the inputs hash the same as on the last successful run"""
+    if not all(os.path.exists(output) for output in task.outputs):
+        return False
+    try:
+        with open(_stamp_path(task)) as f:
+            return json.load(f) == fingerprint
+    except (OSError, ValueError):
+        return False
+
+def _write_stamp(task, fingerprint):
+    os.makedirs(STAMP_DIR, exist_ok=True)
+    with open(_stamp_path(task), "w") as f:
+        json.dump(fingerprint, f, indent=2)
+
+def _init_worker():
+    # Plots are only saved, never shown, so workers must not need a display
+    import matplotlib
+    matplotlib.use("Agg")
+
+def _run_task(func, args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+def dependencies(tasks):
+    """Map each task name to the names of the tasks producing its inputs"""
+    producers = {}
+    for task in tasks:
+        for output in task.outputs:
+            if output in producers:
+                raise ValueError(f"{output} is produced by both {producers[output]} and {task.name}")
+            producers[output] = task.name
+    return {task.name: {producers[path] for path in task.inputs if path in producers} for task in tasks}
+
+def run(tasks, jobs=None, force=False):
+    """
+    Run the tasks on a process pool, skipping those whose inputs did not change.
+
+    A task starts as soon as the tasks producing its inputs have finished. If a dependency
+    fails, everything downstream of it is skipped.
+
+    Args:
+        tasks (list): Tasks to run
+        jobs (int): Number of worker processes (default: number of CPUs)
+        force (bool): Run every task even if it is up to date
+
+    Returns:
+        dict: Task name -> 'ran', 'skipped', 'failed' or 'blocked'
+    """
+    os.environ["MPLBACKEND"] = "Agg"  # inherited by the workers
+    deps = dependencies(tasks)
+    by_name = {task.name: task for task in tasks}
+    status = {}
+    ran = set()
+    start = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker) as executor:
+        running = {}
+        while len(status) < len(tasks):
+            settled = len(status)
+            for task in tasks:
+                if task.name in status or task.name in running.values():
+                    continue
+                if any(status.get(dep) in ("failed", "blocked") for dep in deps[task.name]):
+                    status[task.name] = "blocked"
+                    print(f"[blocked] {task.name}: a dependency failed", flush=True)
+                    continue
+                if not all(dep in status for dep in deps[task.name]):
+                    continue
+
+                fingerprint = _fingerprint(task)
+                if not force and not (deps[task.name] & ran) and is_up_to_date(task, fingerprint):
+                    status[task.name] = "skipped"
+                    print(f"[skipped] {task.name}: up to date", flush=True)
+                    continue
+                future = executor.submit(_run_task, task.func, task.args)
+                future.fingerprint = fingerprint
+                running[future] = task.name
+
+            if not running:
+                if len(status) == settled:
+                    raise ValueError("Tasks depend on each other in a cycle: " + ", ".join(t.name for t in tasks if t.name not in status))
+                continue
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    elapsed = future.result()
+                except Exception:
+                    status[name] = "failed"
+                    print(f"[failed] {name}:\n{traceback.format_exc()}", flush=True)
+                    continue
+                status[name] = "ran"
+                ran.add(name)
+                _write_stamp(by_name[name], future.fingerprint)
+                print(f"[ran] {name} in {elapsed:.1f}s", flush=True)
+
+    counts = {state: list(status.values()).count(state) for state in ("ran", "skipped", "failed", "blocked")}
+    print(f"Pipeline finished in {time.perf_counter() - start:.1f}s: "
+          + ", ".join(f"{count} {state}" for state, count in counts.items() if count), flush=True)
+    return status
@@ -0,0 +1,161 @@
+import os
+import sys
+import json
+import threading
+import tracemalloc
+
+from pathlib import Path
+from datetime import datetime
+from collections import Counter
+
+TOP_ALLOCATIONS = 10
+SAMPLE_INTERVAL = 0.005 # seconds between stack samples of the CPU profiler
+
+# Allocations made by the profiler and the import machinery are noise in the per-turn diffs
+IGNORED_FILES = frozenset([
+    tracemalloc.__file__,
+    "<frozen importlib._bootstrap>",
+    "<frozen importlib._bootstrap_external>",
+    "<unknown>",
+])
+
+class MemoryProfiler:
+    def __init__(self, output_dir, top=TOP_ALLOCATIONS, frames=1):
+        """
+        Per-turn tracemalloc snapshots, diffed against the previous turn to show where memory grows.
+
+        Every turn appends one JSON line to <output_dir>/memory-<time>.jsonl with the traced memory,
+        the agent's buffer sizes and the allocation sites that grew the most.
+
+        Args:
+            output_dir (Path): Where the profiles are written
+            top (int): Allocation sites reported per turn
+            frames (int): Stack frames stored per allocation (more is slower but groups by caller)
+        """
+        self.output_dir = Path(output_dir)
+        self.top = top
+        self.frames = frames
+        self.enabled = False
+        self._log = None
+
+    def _top_growth(self, snapshot, since):
+        # filtering the few grouped statistics is much cheaper than Snapshot.filter_traces on every trace
+        stats = (stat for stat in snapshot.compare_to(since, "traceback") if stat.traceback[-1].filename not in IGNORED_FILES)
+        return [stat for stat, _ in zip(stats, range(self.top))]
+
+    def start(self):
+        if self.enabled:
+            return None
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.path = self.output_dir / f"memory-{datetime.now():%Y%m%d-%H%M%S}.jsonl"
+        self._log = open(self.path, "w", encoding="utf-8")
+        tracemalloc.start(self.frames)
+        self.first = self.previous = tracemalloc.take_snapshot()
+        self.enabled = True
+        return self.path
+
+    def record_turn(self, turn, buffers):
+        """Snapshot after a turn, log the top growing allocation sites and the buffer sizes"""
+        if not self.enabled:
+            return None
+        snapshot = tracemalloc.take_snapshot()
+        traced, peak = tracemalloc.get_traced_memory()
+        record = {
+            "turn": turn,
+            "time": datetime.now().isoformat(),
+            "traced_mb": round(traced / 1e6, 3),
+            "peak_mb": round(peak / 1e6, 3),
+            "buffers": buffers,
+            "top": [
+                {"site": str(stat.traceback), "size_diff_kb": round(stat.size_diff / 1024, 1),
+                 "count_diff": stat.count_diff, "size_kb": round(stat.size / 1024, 1)}
+                for stat in self._top_growth(snapshot, self.previous)
+            ]
+        }
+        self.previous = snapshot
+        self._log.write(json.dumps(record) + "\n")
+        self._log.flush()
+
+        top = record["top"][0] if record["top"] else None
+        print(f"[profile] turn {turn}: {record['traced_mb']:.1f}MB traced (peak {record['peak_mb']:.1f}MB), "
+              f"buffers {buffers}" + (f", top growth {top['size_diff_kb']:+.1f}KB at {top['site']}" if top else ""),
+              file=sys.stderr, flush=True)
+        return record
+
+    def stop(self):
+        """Stop tracing and log the sites that grew the most since profiling started"""
+        if not self.enabled:
+            return None
+        growth = self._top_growth(tracemalloc.take_snapshot(), self.first)
+        self._log.write(json.dumps({"since_start": [
+            {"site": str(stat.traceback), "size_diff_kb": round(stat.size_diff / 1024, 1), "count_diff": stat.count_diff}
+            for stat in growth
+        ]}) + "\n")
+        self._log.close()
+        tracemalloc.stop()
+        self.enabled = False
+        return self.path
+
+class SamplingProfiler:
+    def __init__(self, output_dir, interval=SAMPLE_INTERVAL):
+        """
+        Statistical CPU profiler: a background thread samples the stack of one thread at a fixed interval.
+
+        Samples are wall-clock, so time spent waiting (e.g. for the GUI or the model) shows up too.
+        The result is written in the collapsed stack format ("outer;inner;leaf count" per line)
+        that flame graph tools read.
+        """
+        self.output_dir = Path(output_dir)
+        self.interval = interval
+        self.enabled = False
+
+    def start(self, thread_id=None):
+        """Start sampling the given thread (default: the calling thread)"""
+        if self.enabled:
+            return
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        self.enabled = True
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self, top=15):
+        """Stop sampling, write the collapsed stacks and print the functions with the most samples"""
+        if not self.enabled:
+            return None
+        self._stop.set()
+        self._thread.join()
+        self.enabled = False
+
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        path = self.output_dir / f"cpu-{datetime.now():%Y%m%d-%H%M%S}.collapsed"
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+        own, total = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            functions = stack.split(";")
+            own[functions[-1]] += count
+            for function in set(functions):
+                total[function] += count
+        print(f"[profile] {self.samples} CPU samples every {self.interval * 1000:.0f}ms, written to {path}", file=sys.stderr)
+        print(f"{'own':>6} {'total':>6}  function", file=sys.stderr)
+        for function, count in own.most_common(top):
+            print(f"{count / max(self.samples, 1):>6.1%} {total[function] / max(self.samples, 1):>6.1%}  {function}", file=sys.stderr)
+        sys.stderr.flush()
+        return path
@@ -0,0 +1,155 @@
+import os
+import sys
+import json
+import queue
+import struct
+import threading
+
+# Every message is a 4-byte big-endian length followed by that many bytes of UTF-8 JSON.
+# Agent -> GUI: {"type": "status" | "delta" | "reply" | "metrics" | "error", ...}
+# GUI -> agent: {"type": "input", "text": ...} or {"type": "command", "name": "start_audio" | "exit"}
+HEADER = struct.Struct(">I")
+MAX_MESSAGE_SIZE = 16 * 1024 * 1024
+
+def encode_message(message):
+    payload = json.dumps(message, ensure_ascii=False).encode("utf-8")
+    return HEADER.pack(len(payload)) + payload
+
+def read_message(stream):
+    """Read one framed message from a binary stream, returns None once the stream is closed"""
+    header = stream.read(HEADER.size)
+    if len(header) < HEADER.size:
+        return None
+    (length,) = HEADER.unpack(header)
+    if length > MAX_MESSAGE_SIZE:
+        raise ValueError(f"Message of {length} bytes exceeds the {MAX_MESSAGE_SIZE} byte limit")
+    payload = stream.read(length)
+    if len(payload) < length:
+        return None
+    return json.loads(payload.decode("utf-8"))
+
+class MessageChannel:
+    def __init__(self, reader, writer, max_queued=256):
+        """
+        Framed, non-blocking message channel between the agent and the GUI.
+
+        Writes are queued and sent by a dedicated thread so a slow or stuck reader never
+        stalls generation or speech. When the reader goes away the channel closes itself.
+
+        Args:
+            reader: Binary stream the GUI writes to (None for an output-only channel)
+            writer: Binary stream the GUI reads from
+            max_queued (int): Maximum number of messages waiting to be written
+        """
+        self.reader = reader
+        self.writer = writer
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._write_loop, name="message-writer", daemon=True)
+        self._thread.start()
+
+    @property
+    def closed(self):
+        return self._closed.is_set()
+
+    def _write_loop(self):
+        while True:
+            message = self._queue.get()
+            if message is None:
+                break
+            try:
+                self.writer.write(encode_message(message))
+                self.writer.flush()
+            except (BrokenPipeError, ConnectionResetError, ValueError, OSError) as e:
+                print(f"GUI stopped reading ({e}), closing the message channel", file=sys.stderr, flush=True)
+                self._closed.set()
+                break
+        # Nothing will be written anymore, unblock any sender waiting on a full queue
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+
+    def send(self, message_type, **fields):
+        """Queue a message, returns False if it could not be delivered"""
+        if self.closed:
+            return False
+        message = {"type": message_type, **fields}
+        try:
+            if message_type == "delta":
+                # Deltas are only a preview of the final reply, drop them rather than wait
+                self._queue.put_nowait(message)
+            else:
+                self._queue.put(message, timeout=1.0)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def status(self, text):
+        return self.send("status", text=text)
+
+    def delta(self, name, text, turn):
+        return self.send("delta", name=name, text=text, turn=turn)
+
+    def reply(self, name, text, turn):
+        return self.send("reply", name=name, text=text, turn=turn)
+
+    def metrics(self, **values):
+        return self.send("metrics", **values)
+
+    def error(self, text):
+        return self.send("error", text=text)
+
+    def read(self):
+        """Block until the next message from the GUI arrives, None once it has gone away"""
+        if self.reader is None or self.closed:
+            return None
+        try:
+            message = read_message(self.reader)
+        except (OSError, ValueError) as e:
+            print(f"Unable to read from the GUI: {e}", file=sys.stderr, flush=True)
+            message = None
+        if message is None:
+            self._closed.set()
+        return message
+
+    def close(self, timeout=2.0):
+        """Flush queued messages (waiting at most timeout seconds) and stop the writer thread"""
+        if not self.closed:
+            try:
+                self._queue.put(None, timeout=timeout)
+            except queue.Full:
+                pass
+        self._thread.join(timeout)
+        self._closed.set()
+
+class NullChannel(MessageChannel):
+    """Channel that discards every message, for running the agent without a GUI"""
+    def __init__(self):
+        self.reader = None
+        self.writer = None
+        self.dropped = 0
+        self._closed = threading.Event()
+
+    def send(self, message_type, **fields):
+        return not self.closed
+
+    def close(self, timeout=2.0):
+        self._closed.set()
+
+def open_stdio_channel():
+    """
+    Take over stdin/stdout for framed messages.
+
+    The real stdout is duplicated for the channel and file descriptor 1 is pointed at stderr,
+    so stray prints (from this code or a library) end up in the debug log instead of corrupting
+    the framing.
+    """
+    sys.stdout.flush()
+    writer = os.fdopen(os.dup(sys.stdout.fileno()), "wb")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    sys.stdout = sys.stderr
+    return MessageChannel(sys.stdin.buffer, writer)
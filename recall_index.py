@@ -0,0 +1,289 @@
+import os
+import re
+import sys
+import math
+import time
+import bisect
+import pickle
+import random
+import argparse
+import tempfile
+import numpy as np
+
+from array import array
+from pathlib import Path
+from collections import Counter
+from conversation_log import TIME_PATTERN, format_turn, iter_log_turns
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+# Function words that would otherwise match most turns (kept small on purpose, names and places must survive)
+STOPWORDS = frozenset("""
+a an the and or but if of to in on at by for with from about as is are was were be been am do does did
+i me my you your he she it we they them his her its our their this that these those what which who
+tell told say said have has had not no yes so can could would should will just than then there here
+""".split())
+
+# Reciprocal rank fusion constant, dampens the weight of the very top ranks
+RRF_K = 60
+# Bytes at the end of the indexed part of the log that must still match for a saved index to be reused
+LOG_CHECK_BYTES = 4096
+
+def tokenize(text):
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+class BM25Index:
+    def __init__(self, k1=1.2, b=0.75):
+        """
+        Incrementally maintained inverted index with BM25 scoring.
+
+        Postings are kept in compact int arrays per term so a lookup only touches the turns
+        that contain one of the query terms, and scoring runs vectorized over those.
+        """
+        self.k1 = k1
+        self.b = b
+        self.doc_lengths = array("i")
+        self.total_length = 0
+        self._postings = {}  # term -> (array of doc ids, array of term frequencies)
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    def add(self, text):
+        """Index a new document and return its id"""
+        doc_id = len(self.doc_lengths)
+        tokens = tokenize(text)
+        for term, tf in Counter(tokens).items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = (array("i"), array("i"))
+            postings[0].append(doc_id)
+            postings[1].append(tf)
+        self.doc_lengths.append(len(tokens))
+        self.total_length += len(tokens)
+        return doc_id
+
+    def search(self, query, k=5, max_doc=None):
+        """Return up to k (doc_id, score) pairs, best first, only among documents with an id below max_doc if given"""
+        terms = [term for term in set(tokenize(query)) if term in self._postings]
+        if not terms:
+            return []
+
+        n_docs = len(self.doc_lengths)
+        avg_length = self.total_length / n_docs if n_docs else 0.0
+        doc_lengths = np.frombuffer(self.doc_lengths, dtype=np.int32)
+
+        ids_per_term, scores_per_term = [], []
+        for term in terms:
+            ids = np.frombuffer(self._postings[term][0], dtype=np.int32)
+            tfs = np.frombuffer(self._postings[term][1], dtype=np.int32).astype(np.float32)
+            if max_doc is not None:
+                # postings are in id order
+                end = np.searchsorted(ids, max_doc)
+                ids, tfs = ids[:end], tfs[:end]
+                if not len(ids):
+                    continue
+            idf = math.log(1 + (n_docs - len(ids) + 0.5) / (len(ids) + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * doc_lengths[ids] / avg_length)
+            ids_per_term.append(ids)
+            scores_per_term.append(idf * tfs * (self.k1 + 1) / (tfs + norm))
+
+        if not ids_per_term:
+            return []
+        if len(ids_per_term) == 1:
+            ids, scores = ids_per_term[0], scores_per_term[0]
+        else:
+            ids, inverse = np.unique(np.concatenate(ids_per_term), return_inverse=True)
+            scores = np.bincount(inverse, weights=np.concatenate(scores_per_term))
+
+        if len(ids) > k:
+            top = np.argpartition(-scores, k)[:k]
+        else:
+            top = np.arange(len(ids))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(ids[i]), float(scores[i])) for i in top]
+
+class HybridRecallIndex:
+    def __init__(self, vector_store=None):
+        """
+        Per-culture recall index over the conversation history.
+
+        Turns are indexed lexically (BM25) so exact tokens such as names, places and
+        vocabulary are found reliably, and the results are fused with the semantic
+        matches of the culture's Chroma store using reciprocal rank fusion.
+
+        Args:
+            vector_store: The culture's Chroma store (None for lexical-only recall)
+        """
+        self.vector_store = vector_store
+        self.lexical = BM25Index()
+        self.turns = []
+        self._turns_by_time = {}
+
+    def __len__(self):
+        return len(self.turns)
+
+    @classmethod
+    def from_log(cls, log_file, vector_store=None):
+        index = cls(vector_store)
+        if Path(log_file).exists():
+            for turn in iter_log_turns(log_file):
+                index.add_turn(turn["time"], turn["user"], turn["response"])
+        return index
+
+    @classmethod
+    def load(cls, log_file, cache_file, vector_store=None):
+        """
+        Like from_log, but starts from the index saved by save() and only parses the turns logged since.
+
+        The saved index is ignored (and the whole log parsed) if it is missing, unreadable or
+        the log no longer starts with the part it was built from.
+        """
+        log_file, cache_file = Path(log_file), Path(cache_file)
+        if not log_file.exists() or not cache_file.exists():
+            return cls.from_log(log_file, vector_store)
+        try:
+            with open(cache_file, "rb") as f:
+                state = pickle.load(f)
+            valid = state["log_size"] <= log_file.stat().st_size and state["log_check"] == _log_check(log_file, state["log_size"])
+        except Exception as e:
+            print(f"Ignoring saved recall index {cache_file}: {e}", file=sys.stderr, flush=True)
+            valid = False
+        if not valid:
+            return cls.from_log(log_file, vector_store)
+
+        index = cls(vector_store)
+        index.lexical, index.turns, index._turns_by_time = state["lexical"], state["turns"], state["turns_by_time"]
+        for turn in iter_log_turns(log_file, offset=state["log_size"]):
+            index.add_turn(turn["time"], turn["user"], turn["response"])
+        return index
+
+    def save(self, log_file, cache_file):
+        """Write the index, with the size of the log it covers, so the next start can load it instead of parsing the log"""
+        log_file, cache_file = Path(log_file), Path(cache_file)
+        log_size = log_file.stat().st_size if log_file.exists() else 0
+        state = {
+            "log_size": log_size,
+            "log_check": _log_check(log_file, log_size),
+            "lexical": self.lexical,
+            "turns": self.turns,
+            "turns_by_time": self._turns_by_time
+        }
+        tmp = cache_file.with_name(cache_file.name + ".tmp")
+        with open(tmp, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, cache_file)
+
+    def add_turn(self, timestamp, user_input, response):
+        # The user's own words are what "what did they tell me" lookups are about, the reply adds context
+        turn_id = self.lexical.add(f"{user_input} {response}")
+        self.turns.append((timestamp, user_input, response))
+        self._turns_by_time[timestamp] = turn_id
+        return turn_id
+
+    def _vector_ranking(self, query, k, max_turn):
+        """Rank turns by the Chroma chunks they appear in (chunks are slices of the conversation log)"""
+        ranking = []
+        for document in self.vector_store.similarity_search(query, k=k):
+            for timestamp in TIME_PATTERN.findall(document.page_content):
+                turn_id = self._turns_by_time.get(timestamp)
+                if turn_id is not None and turn_id < max_turn and turn_id not in ranking:
+                    ranking.append(turn_id)
+        return ranking
+
+    def search(self, query, k=5, use_vectors=True, before=None):
+        """
+        Find the turns most relevant to the query.
+
+        Args:
+            query (str): What to look up, e.g. the user's latest message
+            k (int): Number of turns to return
+            use_vectors (bool): Fuse in the vector store ranking (slower, needs an embedding of the query)
+            before (str): Only consider turns logged before this ISO timestamp, e.g. those not in the short-term memory
+
+        Returns:
+            list: Up to k dicts with the turn's time, user input, response and fused score
+        """
+        # turns are added in time order, so the turns before a time are a prefix
+        max_turn = len(self.turns) if before is None else bisect.bisect_left(self.turns, before, key=lambda turn: turn[0])
+        if max_turn == 0:
+            return []
+        rankings = [[turn_id for turn_id, _ in self.lexical.search(query, k=k * 2, max_doc=max_turn)]]
+        if use_vectors and self.vector_store is not None:
+            try:
+                rankings.append(self._vector_ranking(query, k, max_turn))
+            except Exception as e:
+                print(f"Vector recall failed: {e}", file=sys.stderr, flush=True)
+
+        fused = Counter()
+        for ranking in rankings:
+            for rank, turn_id in enumerate(ranking):
+                fused[turn_id] += 1 / (RRF_K + rank + 1)
+
+        results = []
+        for turn_id, score in fused.most_common(k):
+            timestamp, user_input, response = self.turns[turn_id]
+            results.append({"time": timestamp, "user": user_input, "response": response, "score": score})
+        return results
+
+def _log_check(log_file, size):
+    """The last bytes of the first `size` bytes of the log, to tell an appended log from a rewritten one"""
+    if size == 0:
+        return b""
+    with open(log_file, "rb") as f:
+        f.seek(max(size - LOG_CHECK_BYTES, 0))
+        return f.read(min(size, LOG_CHECK_BYTES))
+
+def _synthetic_log(path, n_turns, seed=42):
+    """Write a conversation log with n_turns turns of random small talk mixed with personal facts"""
+    rng = random.Random(seed)
+    filler = ("food culture holiday weather music travel family school work weekend movie book language "
+              "lesson practice word phrase dinner breakfast friend city museum train coffee").split()
+    names = [f"name{i}" for i in range(5000)]
+    places = [f"place{i}" for i in range(5000)]
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(n_turns):
+            words = rng.choices(filler, k=rng.randint(4, 12))
+            if rng.random() < 0.2:
+                words += ["my", "friend", rng.choice(names), "lives", "in", rng.choice(places)]
+            f.write(format_turn(f"2025-01-01T00:00:{i:08d}", " ".join(words), "Sophie",
+                                " ".join(rng.choices(filler, k=rng.randint(10, 30)))))
+
+def _scaling_benchmark(sizes, queries=2000):
+    print(f"{'turns':>9} {'parse+index':>12} {'saved load':>11} {'p50 lookup':>11} {'p99 lookup':>11}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_turns in sizes:
+            log_file = Path(tmp) / f"synthetic_{n_turns}.txt"
+            _synthetic_log(log_file, n_turns)
+
+            start = time.perf_counter()
+            index = HybridRecallIndex.from_log(log_file)
+            build = time.perf_counter() - start
+
+            # a later start: load the saved index and parse only the turns appended since
+            cache_file = Path(tmp) / f"synthetic_{n_turns}.pkl"
+            index.save(log_file, cache_file)
+            with open(log_file, "a", encoding="utf-8") as f:
+                f.write(format_turn("2025-01-02T00:00:00", "my friend name1 lives in place1", "Sophie", "Nice!"))
+            start = time.perf_counter()
+            index = HybridRecallIndex.load(log_file, cache_file)
+            load = time.perf_counter() - start
+            assert len(index) == n_turns + 1
+
+            rng = random.Random(0)
+            timings = []
+            for _ in range(queries):
+                query = f"what did I tell you about name{rng.randrange(5000)} or place{rng.randrange(5000)}"
+                start = time.perf_counter()
+                index.search(query, k=5, use_vectors=False)
+                timings.append(time.perf_counter() - start)
+            timings.sort()
+            print(f"{n_turns:>9} {build:>11.2f}s {load:>10.2f}s {timings[len(timings) // 2] * 1e3:>9.3f}ms "
+                  f"{timings[int(len(timings) * 0.99)] * 1e3:>9.3f}ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scaling benchmark of the lexical recall path on synthetic logs")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 300_000])
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+    _scaling_benchmark(args.sizes, args.queries)
@@ -0,0 +1,101 @@
+import numpy as np
+
+from concurrent.futures import ProcessPoolExecutor
+
+# Resamples are drawn in chunks, each with its own child seed, so the results only depend on
+# the seed and the data and not on how many processes share the work
+MAX_CHUNK_SIZE = 5000
+# Values per (group, resample, padded participant) array of a chunk. The bootstrap holds a few
+# arrays of this size at once, about 32 bytes per element, so this caps a chunk near 130 MB.
+CHUNK_ELEMENTS = 4_000_000
+
+def chunk_size(n_groups, max_n, budget=CHUNK_ELEMENTS):
+    """Resamples per chunk so that a chunk's (groups, resamples, max_n) arrays stay within the element budget"""
+    return int(np.clip(budget // max(n_groups * max_n, 1), 1, MAX_CHUNK_SIZE))
+
+def pad_groups(groups):
+    """
+    Stack paired differences of unequal length into one zero-padded matrix.
+
+    Returns:
+        tuple: (differences of shape (groups, max_n), group sizes)
+    """
+    sizes = np.array([len(values) for values in groups])
+    padded = np.zeros((len(groups), sizes.max(initial=0)))
+    for i, values in enumerate(groups):
+        padded[i, :len(values)] = values
+    return padded, sizes
+
+def _resample_chunk(differences, sizes, n_resamples, seed):
+    """Permutation and bootstrap means of every group for one chunk of resamples"""
+    rng = np.random.default_rng(seed)
+    n_groups, max_n = differences.shape
+    safe_sizes = np.maximum(sizes, 1)
+
+    # Paired permutation test: under H0 every difference is equally likely to have either sign.
+    # Padding is zero so it drops out of the sums.
+    signs = rng.choice(np.array([-1.0, 1.0]), size=(n_resamples, max_n))
+    permuted_means = signs @ differences.T / safe_sizes  # (resamples, groups)
+
+    # Bootstrap: draw n indices with replacement within each group, padding is masked out
+    draws = (rng.random((n_groups, n_resamples, max_n)) * safe_sizes[:, None, None]).astype(np.intp)
+    values = np.take_along_axis(differences[:, None, :], draws, axis=2)
+    mask = np.arange(max_n) < sizes[:, None]
+    bootstrap_means = (values * mask[:, None, :]).sum(axis=2) / safe_sizes[:, None]  # (groups, resamples)
+
+    return permuted_means, bootstrap_means.T
+
+def paired_resampling(groups, n_resamples=20000, confidence=0.95, seed=42, jobs=1):
+    """
+    Paired permutation tests and bootstrap confidence intervals for several groups at once.
+
+    All groups share one batch of resamples per chunk, so every language and engagement
+    category is handled by the same few array operations.
+
+    Args:
+        groups (dict): Group name -> paired differences (condition A minus condition B)
+        n_resamples (int): Number of permutations and bootstrap samples per group
+        confidence (float): Coverage of the percentile bootstrap interval
+        seed (int): Seed for reproducible results
+        jobs (int): Worker processes to spread the chunks over (1 runs in this process)
+
+    Returns:
+        list: One dict per group with N, Mean_Difference, Effect_Size (Cohen's d_z), CI bounds and p-value
+    """
+    names = list(groups)
+    arrays = [np.asarray(groups[name], dtype=float) for name in names]
+    arrays = [values[~np.isnan(values)] for values in arrays]
+    differences, sizes = pad_groups(arrays)
+
+    size = chunk_size(*differences.shape)
+    chunks = [min(size, n_resamples - start) for start in range(0, n_resamples, size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+    args = [(differences, sizes, chunk, chunk_seed) for chunk, chunk_seed in zip(chunks, seeds)]
+
+    if jobs > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(_resample_chunk, *zip(*args)))
+    else:
+        results = [_resample_chunk(*chunk_args) for chunk_args in args]
+
+    permuted_means = np.concatenate([permuted for permuted, _ in results])
+    bootstrap_means = np.concatenate([bootstrap for _, bootstrap in results])
+
+    alpha = (1 - confidence) / 2
+    rows = []
+    for i, (name, values) in enumerate(zip(names, arrays)):
+        observed = values.mean() if len(values) else np.nan
+        sd = values.std(ddof=1) if len(values) > 1 else np.nan
+        extreme = np.sum(np.abs(permuted_means[:, i]) >= abs(observed) - 1e-12)
+        low, high = np.quantile(bootstrap_means[:, i], [alpha, 1 - alpha]) if len(values) else (np.nan, np.nan)
+        rows.append({
+            "Group": name,
+            "N": len(values),
+            "Mean_Difference": observed,
+            "Effect_Size": observed / sd if sd else np.nan,
+            "CI_Low": low,
+            "CI_High": high,
+            "Permutation_p": (extreme + 1) / (n_resamples + 1) if len(values) else np.nan,
+            "Resamples": n_resamples
+        })
+    return rows
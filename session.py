@@ -0,0 +1,93 @@
+import os
+import json
+
+# The snapshot is rewritten as one compact record after this many appended records
+COMPACT_EVERY = 200
+
+class SessionSnapshot:
+    def __init__(self, path, compact_every=COMPACT_EVERY):
+        """
+        Append-only JSON lines snapshot of the live session, so a crashed or closed agent can resume.
+
+        The first record holds the whole session state, every later record only what one
+        turn changed. Writing a turn is a single small append, loading folds the records.
+
+        Args:
+            path (Path): Snapshot file, e.g. pen_pal_data/session.jsonl
+            compact_every (int): Appended records after which the file is rewritten as one record
+        """
+        self.path = path
+        self.compact_every = compact_every
+        self.records = 0
+        self._file = None
+
+    def start(self, state):
+        """Begin a new snapshot with the full session state (replacing any earlier one)"""
+        self.close()
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"type": "session", **state}, ensure_ascii=False) + "\n")
+        os.replace(tmp, self.path)
+        self._file = open(self.path, "a", encoding="utf-8")
+        self.records = 0
+
+    def append(self, record, full_state=None):
+        """
+        Append one incremental record and flush it to the OS, so it survives the process crashing.
+
+        Args:
+            record (dict): What changed, see load() for the record types
+            full_state (callable): Returns the full state, used to compact the file once it grew
+        """
+        if self._file is None:
+            return
+        if full_state is not None and self.records >= self.compact_every:
+            self.start(full_state())
+            return
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        self.records += 1
+
+    def load(self):
+        """
+        Fold the snapshot back into the session state, None if there is nothing to resume.
+
+        Records are {"type": "session", ...full state}, {"type": "state", ...changed fields} and
+        {"type": "turn", "user", "response", ...changed fields}. A turn in another culture than the
+        previous one starts a fresh short-term memory, like switch_personality does. A last line cut
+        short by a crash is ignored.
+        """
+        if not self.path.exists():
+            return None
+
+        state = None
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                record_type = record.pop("type", None)
+                if record_type == "session":
+                    state = record
+                    state.setdefault("exchanges", [])
+                    state.setdefault("vocabulary", {})
+                    continue
+                if state is None:
+                    continue
+
+                if record.get("culture", state.get("culture")) != state.get("culture"):
+                    state["exchanges"] = []
+                vocabulary = record.pop("vocabulary", {})
+                state["vocabulary"].update(vocabulary)
+                if record_type == "turn":
+                    exchange = [record.pop("user"), record.pop("response")]
+                    if record.pop("remembered", True):
+                        state["exchanges"].append(exchange)
+                state.update(record)
+        return state
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
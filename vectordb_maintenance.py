@@ -0,0 +1,269 @@
+import sys
+import json
+import time
+import shutil
+import argparse
+import threading
+import numpy as np
+
+from pathlib import Path
+from datetime import datetime, timedelta
+from conversation_log import TIME_PATTERN
+
+BATCH_SIZE = 1000
+LATENCY_QUERIES = 50
+
+def directory_size(path):
+    return sum(f.stat().st_size for f in Path(path).rglob("*") if f.is_file())
+
+def chunk_timestamp(document, metadata):
+    """When a chunk was logged: its timestamp metadata, or the first TIME line of older chunks"""
+    if metadata and metadata.get("timestamp"):
+        return metadata["timestamp"]
+    match = TIME_PATTERN.search(document or "")
+    return match.group(1) if match else None
+
+def tombstone_file(store_path):
+    """Where the ids deleted from a store are recorded, next to the store so a rebuild keeps them"""
+    store_path = Path(store_path)
+    return store_path.with_name(store_path.name + ".deleted")
+
+def load_tombstones(store_path):
+    """Ids deleted by the retention policy, the startup sync must not add these chunks back"""
+    path = tombstone_file(store_path)
+    if not path.exists():
+        return set()
+    with open(path, encoding="utf-8") as f:
+        return {line.strip() for line in f if line.strip()}
+
+def record_tombstones(store_path, ids):
+    with open(tombstone_file(store_path), "a", encoding="utf-8") as f:
+        f.writelines(f"{chunk_id}\n" for chunk_id in ids)
+
+def _normalized(text):
+    return " ".join(text.split()).lower()
+
+def find_duplicates(documents, embeddings, similarity=0.98, block_size=1024):
+    """
+    Indices of chunks that repeat an earlier chunk, either word for word or with a
+    cosine similarity of at least `similarity` between their embeddings.
+    """
+    duplicates = set()
+    seen = {}
+    for i, document in enumerate(documents):
+        key = _normalized(document or "")
+        if key in seen:
+            duplicates.add(i)
+        else:
+            seen[key] = i
+
+    if similarity >= 1 or len(embeddings) < 2:
+        return duplicates
+
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    for start in range(0, len(vectors), block_size):
+        block = vectors[start:start + block_size]
+        # only compare with earlier chunks so the first occurrence is the one kept
+        sims = block @ vectors[:start + len(block)].T
+        for offset, row in enumerate(sims):
+            i = start + offset
+            if i not in duplicates and np.any(row[:i] >= similarity):
+                duplicates.add(i)
+    return duplicates
+
+def select_expired(timestamps, max_age_days=None, max_chunks=None, size_ratio=None):
+    """
+    Indices of chunks to drop under the retention policy (oldest first).
+
+    Args:
+        timestamps (list): ISO timestamp per chunk (None if unknown, those are treated as oldest)
+        max_age_days (float): Drop chunks older than this
+        max_chunks (int): Keep at most this many chunks
+        size_ratio (float): Keep only this fraction of the chunks (derived from a size budget)
+    """
+    expired = set()
+    if max_age_days is not None:
+        cutoff = (datetime.now() - timedelta(days=max_age_days)).isoformat()
+        expired.update(i for i, ts in enumerate(timestamps) if ts is not None and ts < cutoff)
+
+    limit = len(timestamps)
+    if max_chunks is not None:
+        limit = min(limit, max_chunks)
+    if size_ratio is not None and size_ratio < 1:
+        limit = min(limit, int(len(timestamps) * size_ratio))
+
+    remaining = [i for i in range(len(timestamps)) if i not in expired]
+    if len(remaining) > limit:
+        remaining.sort(key=lambda i: timestamps[i] or "")
+        expired.update(remaining[:len(remaining) - limit])
+    return expired
+
+def _open_store(path, embedding_function=None):
+    from langchain_chroma import Chroma
+    return Chroma(persist_directory=str(path), embedding_function=embedding_function)
+
+def _load_all(store):
+    data = store.get(include=["documents", "metadatas", "embeddings"])
+    embeddings = data["embeddings"] if data["embeddings"] is not None else []
+    return data["ids"], data["documents"], data["metadatas"], np.asarray(embeddings, dtype=np.float32)
+
+def query_latency(store, sample_vectors, k=4):
+    """Median seconds for a similarity search, using stored vectors as queries (no embedding model needed)"""
+    if len(sample_vectors) == 0:
+        return 0.0
+    timings = []
+    for vector in sample_vectors:
+        start = time.perf_counter()
+        store.similarity_search_by_vector(vector.tolist(), k=k)
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings))
+
+def enforce_retention(store, max_age_days=None, max_chunks=None, max_bytes=None, current_bytes=None, similarity=0.98,
+                      store_path=None):
+    """
+    Delete expired and duplicate chunks from an open store, returns the number of chunks removed.
+
+    With store_path the deleted ids are recorded as tombstones, so they stay deleted when the
+    agent syncs the store with the conversation log on its next start.
+    """
+    ids, documents, metadatas, embeddings = _load_all(store)
+    if not ids:
+        return 0
+
+    to_delete = find_duplicates(documents, embeddings, similarity)
+    timestamps = [chunk_timestamp(doc, meta) for doc, meta in zip(documents, metadatas)]
+    size_ratio = max_bytes / current_bytes if max_bytes and current_bytes else None
+    kept = [i for i in range(len(ids)) if i not in to_delete]
+    expired = select_expired([timestamps[i] for i in kept], max_age_days, max_chunks, size_ratio)
+    to_delete.update(kept[i] for i in expired)
+
+    doomed = [ids[i] for i in sorted(to_delete)]
+    if doomed and store_path is not None:
+        record_tombstones(store_path, doomed)
+    for start in range(0, len(doomed), BATCH_SIZE):
+        store.delete(ids=doomed[start:start + BATCH_SIZE])
+    return len(doomed)
+
+def rebuild(path):
+    """Copy the live chunks into a fresh store and swap it in, dropping deleted rows and index garbage"""
+    import chromadb
+
+    path = Path(path)
+    store = _open_store(path)
+    collection_name = store._collection.name
+    ids, documents, metadatas, embeddings = _load_all(store)
+    del store
+
+    compact_path = path.with_name(path.name + ".compact")
+    shutil.rmtree(compact_path, ignore_errors=True)
+    client = chromadb.PersistentClient(path=str(compact_path))
+    collection = client.create_collection(collection_name)
+    for start in range(0, len(ids), BATCH_SIZE):
+        end = start + BATCH_SIZE
+        collection.add(
+            ids=ids[start:end],
+            documents=documents[start:end],
+            metadatas=[meta or None for meta in metadatas[start:end]],
+            embeddings=embeddings[start:end].tolist()
+        )
+    del collection, client
+    # Chroma caches one client per path, drop it so the swapped-in directory is opened fresh
+    chromadb.api.client.SharedSystemClient.clear_system_cache()
+
+    old_path = path.with_name(path.name + ".old")
+    shutil.rmtree(old_path, ignore_errors=True)
+    path.rename(old_path)
+    compact_path.rename(path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+def maintain(path, max_age_days=None, max_chunks=None, max_mb=None, similarity=0.98, compact=True):
+    """Enforce the retention policy on one culture's store and report before/after size and latency"""
+    path = Path(path)
+    store = _open_store(path)
+    ids, _, _, embeddings = _load_all(store)
+    # stored vectors double as queries, the same sample is timed before and after
+    rng = np.random.default_rng(42)
+    sample = embeddings[rng.choice(len(embeddings), size=min(LATENCY_QUERIES, len(embeddings)), replace=False)]
+
+    report = {
+        "store": path.name,
+        "chunks_before": len(ids),
+        "mb_before": directory_size(path) / 1e6,
+        "query_ms_before": query_latency(store, sample) * 1000,
+    }
+    report["removed"] = enforce_retention(
+        store, max_age_days, max_chunks,
+        max_bytes=max_mb * 1e6 if max_mb else None,
+        current_bytes=report["mb_before"] * 1e6,
+        similarity=similarity,
+        store_path=path
+    )
+    del store
+
+    if compact:
+        rebuild(path)
+
+    store = _open_store(path)
+    report["chunks_after"] = store._collection.count()
+    report["mb_after"] = directory_size(path) / 1e6
+    report["query_ms_after"] = query_latency(store, sample) * 1000
+    return report
+
+def start_background_maintenance(vector_stores, interval_minutes, max_age_days=None, max_chunks=None, similarity=0.98,
+                                 store_paths=None):
+    """
+    Periodically enforce the retention policy on open stores from a daemon thread.
+
+    store_paths maps each culture to its store's path, where the tombstones are recorded.
+
+    Only expired and duplicate chunks are deleted here, rebuilding the store on disk
+    needs exclusive access and is left to the maintenance command.
+    """
+    stop = threading.Event()
+
+    def _loop():
+        while not stop.wait(interval_minutes * 60):
+            for culture, store in vector_stores.items():
+                # stores opened on demand (low-memory mode) are only maintained while they are open, and through
+                # the store itself so maintenance does not count as use and keep an idle store from being released
+                if not getattr(store, "is_open", True):
+                    continue
+                store = getattr(store, "store", store)
+                if store is None:
+                    continue
+                try:
+                    removed = enforce_retention(store, max_age_days, max_chunks, similarity=similarity,
+                                                store_path=(store_paths or {}).get(culture))
+                    if removed:
+                        print(f"Vector store maintenance removed {removed} chunks for {culture}", file=sys.stderr, flush=True)
+                except Exception as e:
+                    print(f"Vector store maintenance failed for {culture}: {e}", file=sys.stderr, flush=True)
+
+    threading.Thread(target=_loop, name="vectordb-maintenance", daemon=True).start()
+    return stop
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Expire, dedupe and compact the per-culture Chroma stores")
+    parser.add_argument("--persistence-dir", default="pen_pal_data")
+    parser.add_argument("--cultures", nargs="*", help="cultures to maintain, e.g. French (default: all stores found)")
+    parser.add_argument("--max-age-days", type=float, help="drop chunks logged longer ago than this")
+    parser.add_argument("--max-chunks", type=int, help="keep at most this many chunks per culture")
+    parser.add_argument("--max-mb", type=float, help="approximate disk budget per culture")
+    parser.add_argument("--similarity", type=float, default=0.98, help="cosine similarity above which chunks are duplicates")
+    parser.add_argument("--no-compact", action="store_true", help="only delete chunks, do not rebuild the store")
+    args = parser.parse_args()
+
+    stores = sorted(Path(args.persistence_dir).glob("*_vectordb"))
+    if args.cultures:
+        # stores are named after the pen pal, e.g. French -> sophie_vectordb
+        with open("cultures/culture_profiles.json") as f:
+            culture_profiles = json.load(f)
+        wanted = {f"{culture_profiles[culture]['name'].lower()}_vectordb" for culture in args.cultures}
+        stores = [store for store in stores if store.name in wanted]
+
+    for store_path in stores:
+        report = maintain(store_path, args.max_age_days, args.max_chunks, args.max_mb, args.similarity, not args.no_compact)
+        print(f"{report['store']}: {report['chunks_before']} -> {report['chunks_after']} chunks "
+              f"({report['removed']} removed), {report['mb_before']:.1f} -> {report['mb_after']:.1f} MB, "
+              f"query {report['query_ms_before']:.2f} -> {report['query_ms_after']:.2f} ms")
@@ -0,0 +1,206 @@
+import re
+import sys
+import json
+import time
+import random
+import argparse
+
+from array import array
+
+# Leitner boxes: a word in box i is due again this many turns after it was last seen or used.
+# Box 0 holds words not introduced yet, the learner using a word moves it up one box.
+LEITNER_INTERVALS = (0, 2, 4, 8, 16, 32)
+ACTIVE_WORDS = 5 # words injected into the system prompt at a time
+
+# Pieces of a vocabulary entry that are not part of what the pen pal or learner actually says
+BLANK = "__"
+PARENTHETICAL = re.compile(r"\([^)]*\)")
+SEPARATORS = re.compile(r"[\s,\-]+")
+EDGE_PUNCTUATION = "¿?¡!.,;: "
+APOSTROPHES = re.compile("['’]")
+
+def word_pattern(word):
+    """
+    Lowercase regex for one words_to_learn entry, tolerant to how it shows up in free text:
+    straight or curly apostrophes, spaces/hyphens/commas between words,
+    a blank (__) in the middle standing for up to three words, and blanks or
+    parentheticals at the edges dropped.
+    """
+    text = PARENTHETICAL.sub(" ", word)
+    parts = [part.strip(EDGE_PUNCTUATION) for part in text.split(BLANK)]
+    parts = [part for part in parts if part]
+
+    def fixed(part):
+        tokens = [APOSTROPHES.sub(APOSTROPHES.pattern, re.escape(token.lower())) for token in SEPARATORS.split(part) if token]
+        return r"[\s,\-]*".join(tokens)
+
+    return r"\W+(?:\w+\W+){0,3}".join(fixed(part) for part in parts)
+
+class WordMatcher:
+    def __init__(self, culture_profiles, cultures=None):
+        """
+        One precompiled multi-pattern matcher for the words_to_learn of several cultures.
+
+        Args:
+            culture_profiles (dict): The parsed cultures/culture_profiles.json
+            cultures (list): Cultures to include (default: all)
+        """
+        patterns = {}
+        for culture in cultures or culture_profiles:
+            for pair in culture_profiles[culture]["words_to_learn"]:
+                pattern = word_pattern(pair["word"])
+                if pattern:
+                    # identical entries (e.g. 'Mañana' for morning and tomorrow) share one pattern
+                    patterns.setdefault(pattern, []).append((culture, pair["word"]))
+
+        # longest first, so an entry is not shadowed by a shorter one starting at the same position
+        ordered = sorted(patterns, key=len, reverse=True)
+        self.entries = [patterns[pattern] for pattern in ordered]
+        # Patterns are lowercase and matched against lowercased text, and every alternative starts with its
+        # literal first character outside the group (the word boundary is checked right after it). The regex
+        # engine then skips to candidate characters and rejects most alternatives on one comparison, which
+        # is many times faster than a case-insensitive alternation of named groups.
+        alternatives = []
+        for i, pattern in enumerate(ordered):
+            head = pattern[:2] if pattern.startswith("\\") else pattern[:1]
+            alternatives.append(f"{head}(?<!\\w.)(?P<w{i}>{pattern[len(head):]})")
+        self.regex = re.compile(rf"(?:{'|'.join(alternatives)})(?!\w)", re.DOTALL)
+
+    def find(self, text):
+        """Yield the index of every vocabulary entry found in the text (see self.entries)"""
+        for match in self.regex.finditer(text.lower()):
+            yield int(match.lastgroup[1:])
+
+    def words(self, text):
+        """Yield (culture, word) for every vocabulary entry found in the text"""
+        for index in self.find(text):
+            yield from self.entries[index]
+
+class VocabularyTracker:
+    def __init__(self, culture_profiles, culture, pool, state_file=None, active_words=ACTIVE_WORDS):
+        """
+        Online exposure tracking and spaced-repetition selection of one culture's words_to_learn.
+
+        Args:
+            culture_profiles (dict): The parsed cultures/culture_profiles.json
+            culture (str): Culture whose words are tracked
+            pool (iterable): Indices into words_to_learn the learner is taught (the experiment's word set)
+            state_file (Path): JSON file the learner's state is loaded from and saved to
+            active_words (int): How many words are selected for the prompt at a time
+        """
+        self.words = [culture_profiles[culture]["words_to_learn"][i] for i in pool]
+        self.state_file = state_file
+        self.active_words = active_words
+        # built once per culture, every turn only runs the compiled regex
+        self.matcher = WordMatcher(culture_profiles, [culture])
+        positions = {}
+        for position, pair in enumerate(self.words):
+            positions.setdefault(pair["word"], []).append(position)
+        # matcher entry -> positions in the pool (entries outside the pool map to nothing)
+        self.entry_positions = [
+            [position for word in {word for _, word in entry} for position in positions.get(word, [])]
+            for entry in self.matcher.entries
+        ]
+
+        self.turn = 0
+        self.box = array("B", [0] * len(self.words))
+        self.due = array("I", [0] * len(self.words))
+        self.exposed = array("I", [0] * len(self.words))
+        self.used = array("I", [0] * len(self.words))
+        if state_file is not None and state_file.exists():
+            with open(state_file, encoding="utf-8") as f:
+                self.load_state(json.load(f))
+        self.selected = self._select()
+
+    def _positions(self, text):
+        for index in self.matcher.find(text):
+            yield from self.entry_positions[index]
+
+    def _select(self):
+        # most overdue first, then lowest box, then the order of words_to_learn
+        order = sorted(range(len(self.words)), key=lambda p: (self.due[p], self.box[p], p))
+        return tuple(sorted(order[:self.active_words]))
+
+    def observe(self, user_input, response):
+        """
+        Count the words the pen pal used (exposure) and the learner used (recall) in one turn.
+
+        Returns:
+            bool: True if the selected words changed and the prompt needs rebuilding
+        """
+        self.turn += 1
+        for position in self._positions(response):
+            self.exposed[position] += 1
+            if self.box[position] == 0:
+                self.box[position] = 1
+            self.due[position] = self.turn + LEITNER_INTERVALS[self.box[position]]
+        for position in self._positions(user_input):
+            self.used[position] += 1
+            self.box[position] = min(self.box[position] + 1, len(LEITNER_INTERVALS) - 1)
+            self.due[position] = self.turn + LEITNER_INTERVALS[self.box[position]]
+
+        selected = self._select()
+        changed = selected != self.selected
+        self.selected = selected
+        return changed
+
+    def selected_words(self):
+        """The words_to_learn entries to inject into the prompt now"""
+        return [self.words[position] for position in self.selected]
+
+    def state(self):
+        return {
+            "turn": self.turn,
+            "words": [pair["word"] for pair in self.words],
+            "box": list(self.box),
+            "due": list(self.due),
+            "exposed": list(self.exposed),
+            "used": list(self.used)
+        }
+
+    def load_state(self, state):
+        """Restore a saved state, ignored if it was saved for a different word set"""
+        if state.get("words") != [pair["word"] for pair in self.words]:
+            return
+        self.turn = state["turn"]
+        for name in ("box", "due", "exposed", "used"):
+            setattr(self, name, array(getattr(self, name).typecode, state[name]))
+        self.selected = self._select()
+
+    def save(self):
+        if self.state_file is None:
+            return
+        tmp = self.state_file.with_name(self.state_file.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.state(), f)
+        tmp.replace(self.state_file)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-turn overhead of the vocabulary tracker")
+    parser.add_argument("--culture", default="French")
+    parser.add_argument("--turns", type=int, default=20000)
+    args = parser.parse_args()
+
+    with open("cultures/culture_profiles.json") as f:
+        culture_profiles = json.load(f)
+    tracker = VocabularyTracker(culture_profiles, args.culture, range(10))
+    words = [pair["word"].replace("__", "") for pair in culture_profiles[args.culture]["words_to_learn"]]
+    filler = "that is a lovely question and I am happy to help you practice a little more today".split()
+
+    rng = random.Random(42)
+    turns = []
+    for _ in range(args.turns):
+        response = " ".join(rng.sample(filler, 12) + rng.sample(words, 2) + rng.sample(filler, 12))
+        user_input = " ".join(rng.sample(filler, 5) + (rng.sample(words, 1) if rng.random() < 0.3 else []))
+        turns.append((user_input, response))
+
+    rebuilds = 0
+    timings = []
+    for user_input, response in turns:
+        start = time.perf_counter()
+        rebuilds += tracker.observe(user_input, response)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    print(f"{args.turns} turns: p50 {timings[len(timings) // 2] * 1e6:.1f}us, "
+          f"p99 {timings[int(len(timings) * 0.99)] * 1e6:.1f}us per turn, prompt rebuilt on {rebuilds} turns", file=sys.stderr)
+    print("boxes:", list(tracker.box), "selected:", [pair["word"] for pair in tracker.selected_words()], file=sys.stderr)